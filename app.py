@@ -1,6 +1,7 @@
 import streamlit as st
 from database import DatabaseManager
 from auth import AuthManager
+from quiz_engine import release_abandoned_prefetch
 
 # Configure the main page
 st.set_page_config(
@@ -26,6 +27,8 @@ def init_session_state():
 
 def main():
     db, auth = init_components()
+    # A quiz prefetched on the Quiz page is not needed once the student leaves it
+    release_abandoned_prefetch(st.session_state)
     init_session_state()
     
     # Enhanced CSS for beautiful styling
@@ -224,4 +227,6 @@ def main():
         st.switch_page("pages/1_🏠_Home.py")
 
 if __name__ == "__main__":
-    main()
+    # Per-rerun query counts when DB_INSTRUMENT=1
+    with init_components()[0].profile(f"Main rerun ({st.session_state.get('user_id', 'anonymous')})"):
+        main()
\ No newline at end of file
@@ -0,0 +1,270 @@
+"""
+Scale benchmarks for the database layer
+
+Seeds a synthetic database at each requested scale (see synthetic_data.py),
+then times every public DatabaseManager and ProgressTracker method against
+randomly chosen students and writes p50/p95/p99 latencies and throughput as
+JSON. Results carry the git commit so runs can be compared across changes:
+
+    python benchmarks/db_benchmark.py --scales 10k 100k --output before.json
+    python benchmarks/db_benchmark.py --scales 10k 100k --output after.json --compare before.json
+"""
+import argparse
+import inspect
+import json
+import os
+import platform
+import random
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database import DatabaseManager
+from progress_tracker import ProgressTracker
+from synthetic_data import BENCHMARK_PASSWORD, parse_scale, seed_database
+
+# Public methods that are not per-request operations
+NOT_BENCHMARKED = {
+    'DatabaseManager.close': "releases resources",
+    'DatabaseManager.transaction': "context manager, exercised through the write methods",
+    'DatabaseManager.profile': "instrumentation helper",
+}
+
+# Stand-in for a generated quiz when exercising the quiz pool
+BENCHMARK_QUIZ = {
+    'title': 'Benchmark Quiz',
+    'questions': [
+        {'question': f'Question {i}', 'options': ['A', 'B', 'C', 'D'], 'correct_answer': i % 4}
+        for i in range(5)
+    ]
+}
+
+class BenchmarkContext:
+    """Random but reproducible inputs drawn from the seeded database"""
+
+    def __init__(self, db_path, seed):
+        self.rng = random.Random(seed)
+        conn = sqlite3.connect(db_path)
+        self.users = conn.execute('SELECT user_id, username FROM users').fetchall()
+        self.topics = conn.execute('SELECT DISTINCT subject, topic FROM progress').fetchall()
+        self.max_attempt_id = conn.execute('SELECT MAX(id) FROM quiz_attempts').fetchone()[0]
+        conn.close()
+
+    def user_id(self):
+        return self.rng.choice(self.users)[0]
+
+    def username(self):
+        return self.rng.choice(self.users)[1]
+
+    def subject(self):
+        return self.rng.choice(self.topics)[0]
+
+    def topic(self):
+        return self.rng.choice(self.topics)
+
+    def attempt_id(self):
+        return self.rng.randint(1, self.max_attempt_id)
+
+    def score(self):
+        return round(self.rng.uniform(0, 100), 1)
+
+def database_cases(ctx):
+    """Map each DatabaseManager method to a factory of (args, kwargs)"""
+    def user_topic():
+        subject, topic = ctx.topic()
+        return ctx.user_id(), subject, topic
+
+    def new_user():
+        name = f'bench_{uuid.uuid4().hex[:12]}'
+        return (name, f'{name}@example.edu', BENCHMARK_PASSWORD, 'Benchmark User'), {}
+
+    return {
+        'init_database': lambda: ((), {}),
+        'ensure_user_exists': lambda: ((ctx.user_id(),), {}),
+        'get_user_progress': lambda: ((ctx.user_id(), ctx.subject()), {}),
+        'get_all_progress': lambda: ((ctx.user_id(),), {}),
+        'get_topic_progress': lambda: (user_topic(), {}),
+        'update_progress': lambda: (user_topic(), {'chat_count': ctx.rng.randint(0, 40)}),
+        'save_quiz_attempt': lambda: (user_topic() + (ctx.score(), {}, {}), {}),
+        'save_chat_session': lambda: (user_topic() + (1,), {}),
+        'record_chat_activity': lambda: (user_topic(), {}),
+        'record_quiz_attempt': lambda: (user_topic() + (ctx.score(), False, {}, {}), {}),
+        'get_quiz_history': lambda: ((ctx.user_id(), ctx.subject()), {}),
+        'get_latest_quiz_attempt': lambda: (user_topic(), {}),
+        'save_quiz_recommendations': lambda: ((ctx.attempt_id(), 'Review the fundamentals.'), {}),
+        'get_quiz_recommendations': lambda: ((ctx.attempt_id(),), {}),
+        'add_pooled_quiz': lambda: (ctx.topic() + ('mixed', 5, BENCHMARK_QUIZ), {}),
+        'take_pooled_quiz': lambda: (ctx.topic() + ('mixed', 5), {}),
+        'count_pooled_quizzes': lambda: (ctx.topic() + ('mixed', 5), {}),
+        'create_user': new_user,
+        'authenticate_user': lambda: ((ctx.username(), BENCHMARK_PASSWORD), {}),
+        'get_user_by_username': lambda: ((ctx.username(),), {}),
+    }
+
+def tracker_cases(ctx):
+    """Map each ProgressTracker method to a factory of (args, kwargs)"""
+    def user_topic():
+        subject, topic = ctx.topic()
+        return ctx.user_id(), subject, topic
+
+    return {
+        'get_user_progress': lambda: ((ctx.user_id(), ctx.subject()), {}),
+        'get_all_progress': lambda: ((ctx.user_id(),), {}),
+        'get_topic_progress': lambda: (user_topic(), {}),
+        'update_chat_progress': lambda: (user_topic(), {}),
+        'update_quiz_progress': lambda: (user_topic() + (ctx.score(),), {}),
+        'get_learning_recommendations': lambda: ((ctx.user_id(), ctx.subject()), {}),
+        'get_learning_streak': lambda: ((ctx.user_id(),), {}),
+        'get_achievement_badges': lambda: ((ctx.user_id(), ctx.subject()), {}),
+        'export_progress_data': lambda: ((ctx.user_id(), ctx.subject()), {}),
+        'get_study_suggestions': lambda: ((ctx.user_id(), ctx.subject()), {}),
+    }
+
+def public_methods(obj):
+    return [
+        name for name, member in inspect.getmembers(type(obj), inspect.isfunction)
+        if not name.startswith('_')
+    ]
+
+def percentile(sorted_values, fraction):
+    """Nearest-rank percentile of an already sorted list"""
+    index = max(0, min(len(sorted_values) - 1, int(round(fraction * len(sorted_values))) - 1))
+    return sorted_values[index]
+
+def time_method(method, make_args, iterations, warmup):
+    for _ in range(warmup):
+        args, kwargs = make_args()
+        method(*args, **kwargs)
+
+    latencies = []
+    started = time.perf_counter()
+    for _ in range(iterations):
+        args, kwargs = make_args()
+        call_started = time.perf_counter()
+        method(*args, **kwargs)
+        latencies.append((time.perf_counter() - call_started) * 1000)
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        'iterations': iterations,
+        'p50_ms': round(percentile(latencies, 0.50), 4),
+        'p95_ms': round(percentile(latencies, 0.95), 4),
+        'p99_ms': round(percentile(latencies, 0.99), 4),
+        'mean_ms': round(sum(latencies) / len(latencies), 4),
+        'max_ms': round(latencies[-1], 4),
+        'ops_per_sec': round(iterations / elapsed, 1) if elapsed > 0 else None,
+    }
+
+def benchmark_objects(db, tracker, ctx, iterations, warmup):
+    results = {}
+    not_covered = []
+
+    for owner, cases in ((db, database_cases(ctx)), (tracker, tracker_cases(ctx))):
+        class_name = type(owner).__name__
+        for name in public_methods(owner):
+            key = f'{class_name}.{name}'
+            if key in NOT_BENCHMARKED:
+                continue
+            if name not in cases:
+                not_covered.append(key)
+                continue
+            results[key] = time_method(getattr(owner, name), cases[name], iterations, warmup)
+
+    return results, not_covered
+
+def run_scale(label, scale, workdir, iterations, warmup, seed):
+    db_path = os.path.join(workdir, f'bench_{label}.db')
+    started = time.perf_counter()
+    summary = seed_database(db_path, scale, seed)
+    seed_seconds = time.perf_counter() - started
+
+    db = DatabaseManager(db_path)
+    tracker = ProgressTracker(db)
+    ctx = BenchmarkContext(db_path, seed)
+    try:
+        results, not_covered = benchmark_objects(db, tracker, ctx, iterations, warmup)
+    finally:
+        db.close()
+
+    return {
+        'rows': summary,
+        'seed_seconds': round(seed_seconds, 2),
+        'methods': results,
+        'not_benchmarked': not_covered,
+    }
+
+def git_commit():
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', 'HEAD'],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            stderr=subprocess.DEVNULL
+        ).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def compare(current, baseline):
+    """Print p50/p95 changes against an earlier result file"""
+    for label, scale_result in current['scales'].items():
+        previous = baseline.get('scales', {}).get(label)
+        if not previous:
+            continue
+        print(f"\n{label} (baseline {(baseline.get('commit') or 'unknown')[:10]})")
+        print(f"{'method':<50} {'p50 ms':>12} {'p95 ms':>12}")
+        for key, stats in sorted(scale_result['methods'].items()):
+            old = previous['methods'].get(key)
+            if not old:
+                print(f"{key:<50} {'new':>12}")
+                continue
+            p50 = stats['p50_ms'] / old['p50_ms'] if old['p50_ms'] else float('inf')
+            p95 = stats['p95_ms'] / old['p95_ms'] if old['p95_ms'] else float('inf')
+            print(f"{key:<50} {p50:>11.2f}x {p95:>11.2f}x")
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the database layer at several data scales")
+    parser.add_argument('--scales', nargs='+', default=['10k', '100k', '1m'],
+                        help="Scales to run: 10k, 100k, 1m or progress row counts")
+    parser.add_argument('--iterations', type=int, default=200)
+    parser.add_argument('--warmup', type=int, default=10)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--workdir', help="Where to create the seeded databases (default: a temp dir)")
+    parser.add_argument('--output', help="Write JSON results here instead of stdout")
+    parser.add_argument('--compare', help="Earlier JSON result to compare against")
+    args = parser.parse_args()
+
+    workdir = args.workdir or tempfile.mkdtemp(prefix='tutor_bench_')
+    os.makedirs(workdir, exist_ok=True)
+
+    report = {
+        'commit': git_commit(),
+        'timestamp': datetime.now().isoformat(),
+        'python': platform.python_version(),
+        'sqlite': sqlite3.sqlite_version,
+        'iterations': args.iterations,
+        'scales': {},
+    }
+    for label in args.scales:
+        report['scales'][label] = run_scale(
+            label, parse_scale(label), workdir, args.iterations, args.warmup, args.seed
+        )
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output)
+    else:
+        print(output)
+
+    if args.compare:
+        with open(args.compare) as f:
+            compare(report, json.load(f))
+
+if __name__ == "__main__":
+    main()
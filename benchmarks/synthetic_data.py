@@ -0,0 +1,152 @@
+"""
+Synthetic data generator for database benchmarks
+
+Seeds a database with the same schema as education_tutor.db (it is created
+through DatabaseManager, so all migrations apply) and fills it with
+realistic-looking students, progress rows, quiz attempts and chat sessions.
+
+The scale is the number of progress rows; quiz attempts and chat sessions
+are generated at roughly the same volume, and each student touches about
+twenty of the fifty topics.
+
+    python benchmarks/synthetic_data.py --scale 100k --db /tmp/bench.db
+"""
+import argparse
+import hashlib
+import json
+import os
+import random
+import sqlite3
+import sys
+import uuid
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from database import DatabaseManager
+from subjects import SUBJECT_TOPICS
+
+SCALES = {'10k': 10_000, '100k': 100_000, '1m': 1_000_000}
+
+# Every synthetic student can log in with this password
+BENCHMARK_PASSWORD = "benchmark-password"
+
+TOPICS_PER_USER = 20
+BATCH_SIZE = 50_000
+
+def parse_scale(value):
+    """Accept 10k/100k/1m or a plain row count"""
+    value = value.lower()
+    if value in SCALES:
+        return SCALES[value]
+    return int(value)
+
+def _timestamp(rng, now, max_days=120):
+    moment = now - timedelta(seconds=rng.randint(0, max_days * 24 * 3600))
+    return moment.strftime('%Y-%m-%d %H:%M:%S')
+
+def _all_topics():
+    return [(subject, topic) for subject, topics in SUBJECT_TOPICS.items() for topic in topics]
+
+def _insert_batches(conn, sql, rows):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= BATCH_SIZE:
+            conn.executemany(sql, batch)
+            batch = []
+    if batch:
+        conn.executemany(sql, batch)
+
+def seed_database(db_path, scale, seed=42):
+    """Create and fill a benchmark database, returning a summary of what was generated"""
+    if os.path.exists(db_path):
+        raise FileExistsError(f"{db_path} already exists")
+
+    # Create the schema exactly as the application would
+    DatabaseManager(db_path).close()
+
+    rng = random.Random(seed)
+    now = datetime.now()
+    topics = _all_topics()
+    num_users = max(1, scale // TOPICS_PER_USER)
+    password_hash = hashlib.sha256(BENCHMARK_PASSWORD.encode()).hexdigest()
+    user_ids = [str(uuid.UUID(int=rng.getrandbits(128))) for _ in range(num_users)]
+
+    conn = sqlite3.connect(db_path)
+    # Bulk load settings; the application's own pragmas apply once it opens the file
+    conn.execute('PRAGMA synchronous = OFF')
+    conn.execute('PRAGMA journal_mode = WAL')
+
+    _insert_batches(conn, '''
+        INSERT INTO users (user_id, username, email, password_hash, full_name, created_at, last_active)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+    ''', (
+        (user_id, f'student_{i}', f'student_{i}@example.edu', password_hash,
+         f'Student {i}', _timestamp(rng, now, 365), _timestamp(rng, now, 7))
+        for i, user_id in enumerate(user_ids)
+    ))
+
+    def progress_rows():
+        remaining = scale
+        for user_id in user_ids:
+            count = min(remaining, TOPICS_PER_USER)
+            remaining -= count
+            for subject, topic in rng.sample(topics, count):
+                best_score = rng.choice([0, 0, rng.uniform(20, 100)])
+                yield (user_id, subject, topic, best_score >= 80, best_score,
+                       rng.randint(0, 40), _timestamp(rng, now))
+
+    _insert_batches(conn, '''
+        INSERT INTO progress (user_id, subject, topic, completed, best_score, chat_count, last_updated)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+    ''', progress_rows())
+
+    questions = json.dumps({})
+    answers = json.dumps({})
+
+    def quiz_rows():
+        for _ in range(scale):
+            subject, topic = rng.choice(topics)
+            yield (rng.choice(user_ids), subject, topic, round(rng.uniform(0, 100), 1),
+                   questions, answers, _timestamp(rng, now))
+
+    _insert_batches(conn, '''
+        INSERT INTO quiz_attempts (user_id, subject, topic, score, questions_data, answers_data, attempt_date)
+        VALUES (?, ?, ?, ?, ?, ?, ?)
+    ''', quiz_rows())
+
+    def chat_rows():
+        for _ in range(scale):
+            subject, topic = rng.choice(topics)
+            yield (rng.choice(user_ids), subject, topic, 1, _timestamp(rng, now))
+
+    _insert_batches(conn, '''
+        INSERT INTO chat_sessions (user_id, subject, topic, message_count, session_date)
+        VALUES (?, ?, ?, ?, ?)
+    ''', chat_rows())
+
+    conn.commit()
+    conn.execute('ANALYZE')
+    conn.close()
+
+    return {
+        'users': num_users,
+        'progress': scale,
+        'quiz_attempts': scale,
+        'chat_sessions': scale,
+        'seed': seed
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Seed a synthetic education_tutor.db-compatible database")
+    parser.add_argument('--scale', default='10k', help="10k, 100k, 1m or a progress row count")
+    parser.add_argument('--db', required=True, help="Path of the database to create")
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    summary = seed_database(args.db, parse_scale(args.scale), args.seed)
+    print(json.dumps(summary, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -1,110 +1,391 @@
 import sqlite3
 import json
 from datetime import datetime
+import atexit
 import os
 import hashlib
+import queue
+import threading
 import uuid
+from contextlib import contextmanager
+import migrations
+from query_stats import QueryStats, InstrumentedConnection
+
+# Progress columns that callers may set through update_progress
+PROGRESS_FIELDS = ('completed', 'best_score', 'chat_count')
+
+# User ids known to have a users row, per database file. Shared by every
+# DatabaseManager in the process so reads never need to check the users table.
+_known_users = {}
+_known_users_lock = threading.Lock()
+
+# Write-behind chat buffer of each database file and how many open
+# DatabaseManagers use it. One buffer per file, so every manager's reads see
+# the counts still waiting in it.
+_chat_buffers = {}
+_chat_buffers_lock = threading.Lock()
+
+# Database files already migrated by this process
+_migrated_paths = set()
+_migrated_lock = threading.Lock()
+
+class ConnectionPool:
+    """Pool of persistent SQLite connections shared by every thread of the process.
+
+    Connections are opened once with WAL journaling and tuned pragmas, then
+    checked out by one thread at a time and returned for reuse, so the hot
+    paths never pay for connection setup. WAL lets readers keep going while
+    a writer commits.
+    """
+
+    def __init__(self, db_path, max_idle=8, busy_timeout_ms=5000,
+                 cache_size_kb=16384, mmap_size=256 * 1024 * 1024, query_stats=None):
+        self.db_path = db_path
+        # When set, connections are instrumented and report to these stats
+        self.query_stats = query_stats
+        self.busy_timeout_ms = busy_timeout_ms
+        self.cache_size_kb = cache_size_kb
+        self.mmap_size = mmap_size
+        # LIFO keeps the most recently used (warmest) connections in play
+        self._idle = queue.LifoQueue(maxsize=max_idle)
+        # Connection currently checked out by each thread, for nesting
+        self._local = threading.local()
+    
+    def _open(self):
+        """Open a new connection and apply the performance pragmas"""
+        conn = sqlite3.connect(
+            self.db_path,
+            timeout=self.busy_timeout_ms / 1000,
+            check_same_thread=False,
+            factory=InstrumentedConnection if self.query_stats else sqlite3.Connection
+        )
+        conn.execute(f'PRAGMA busy_timeout = {int(self.busy_timeout_ms)}')
+        conn.execute('PRAGMA journal_mode = WAL')
+        # NORMAL is durable across application crashes in WAL mode and
+        # avoids an fsync on every commit
+        conn.execute('PRAGMA synchronous = NORMAL')
+        conn.execute(f'PRAGMA cache_size = -{int(self.cache_size_kb)}')
+        conn.execute(f'PRAGMA mmap_size = {int(self.mmap_size)}')
+        conn.execute('PRAGMA temp_store = MEMORY')
+        # Attached only now, so the setup pragmas are not counted as the
+        # queries of whichever scope happened to open the connection
+        if self.query_stats:
+            conn.stats = self.query_stats
+        return conn
+    
+    def _acquire(self):
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            return self._open()
+    
+    def _release(self, conn):
+        try:
+            self._idle.put_nowait(conn)
+        except queue.Full:
+            conn.close()
+    
+    @contextmanager
+    def connection(self, immediate=False):
+        """Check out a connection, committing on success and rolling back on error
+        
+        Calls nested inside an open connection on the same thread reuse it and
+        join its transaction; only the outermost block commits. immediate=True
+        takes the write lock up front so a read-then-write unit of work cannot
+        fail to upgrade its lock halfway through.
+        """
+        held = getattr(self._local, 'conn', None)
+        if held is not None:
+            yield held
+            return
+        
+        conn = self._acquire()
+        self._local.conn = conn
+        self._local.on_commit = []
+        try:
+            if immediate:
+                conn.execute('BEGIN IMMEDIATE')
+            yield conn
+            conn.commit()
+        except BaseException:
+            self._local.conn = None
+            try:
+                conn.rollback()
+            except sqlite3.Error:
+                # The connection is unusable, do not hand it out again
+                conn.close()
+                raise
+            self._release(conn)
+            raise
+        
+        callbacks = self._local.on_commit
+        self._local.conn = None
+        self._release(conn)
+        for callback in callbacks:
+            callback()
+    
+    def on_commit(self, callback):
+        """Run callback once the current thread's outermost transaction commits"""
+        if getattr(self._local, 'conn', None) is None:
+            callback()
+        else:
+            self._local.on_commit.append(callback)
+    
+    def close(self):
+        """Close every idle connection"""
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                break
+
+class ChatWriteBuffer:
+    """Write-behind queue for chat activity.
+    
+    Increments are coalesced per (user, subject, topic) in memory and written
+    in one batch by a background thread, either every flush_interval seconds
+    or as soon as flush_size increments are waiting. Pending counts stay
+    visible to reads through pending_for, and everything is flushed on close
+    and at interpreter exit. Each database file has one buffer, shared by
+    every DatabaseManager of the process.
+    """
+    
+    def __init__(self, db, flush_interval=2.0, flush_size=200):
+        self.db = db
+        self.flush_interval = flush_interval
+        self.flush_size = flush_size
+        self._pending = {}
+        self._pending_total = 0
+        # Batch currently being written, still counted by pending_for
+        self._flushing = {}
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='chat-write-buffer', daemon=True)
+        self._thread.start()
+        atexit.register(self.close)
+    
+    def add(self, user_id, subject, topic, message_count=1):
+        """Queue a chat count increment"""
+        key = (user_id, subject, topic)
+        with self._lock:
+            self._pending[key] = self._pending.get(key, 0) + message_count
+            self._pending_total += message_count
+            full = self._pending_total >= self.flush_size
+        
+        if full:
+            self._wake.set()
+    
+    def pending_for(self, user_id):
+        """Get unflushed chat counts for a user, keyed by (subject, topic)"""
+        counts = {}
+        with self._lock:
+            for source in (self._flushing, self._pending):
+                for (pending_user, subject, topic), count in source.items():
+                    if pending_user == user_id:
+                        counts[(subject, topic)] = counts.get((subject, topic), 0) + count
+        return counts
+    
+    def flush(self):
+        """Write every queued increment to the database"""
+        with self._flush_lock:
+            with self._lock:
+                if not self._pending:
+                    return
+                batch = self._flushing = self._pending
+                self._pending = {}
+                self._pending_total = 0
+            
+            try:
+                # The batch stops counting as pending the moment it is
+                # committed, so reads never see it both there and in the table
+                self.db._write_chat_batch(batch, on_commit=self._flushed)
+            except Exception:
+                # Put the batch back so the next flush retries it
+                with self._lock:
+                    self._flushing = {}
+                    for key, count in batch.items():
+                        self._pending[key] = self._pending.get(key, 0) + count
+                        self._pending_total += count
+                raise
+    
+    def _flushed(self):
+        with self._lock:
+            self._flushing = {}
+    
+    def _run(self):
+        while not self._stopped.is_set():
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"Error flushing chat activity: {e}")
+    
+    def close(self):
+        """Stop the background thread and flush whatever is left"""
+        if not self._stopped.is_set():
+            self._stopped.set()
+            self._wake.set()
+            self._thread.join()
+            atexit.unregister(self.close)
+        self.flush()
 
 class DatabaseManager:
-    def __init__(self, db_path="education_tutor.db"):
+    def __init__(self, db_path="education_tutor.db", pool_size=8, busy_timeout_ms=5000,
+                 write_behind=None, flush_interval=2.0, flush_size=200, instrument=None):
         self.db_path = db_path
+        
+        # Query instrumentation is off unless requested
+        if instrument is None:
+            instrument = os.getenv("DB_INSTRUMENT") == "1"
+        self.query_stats = QueryStats(
+            slow_query_ms=float(os.getenv("DB_SLOW_QUERY_MS", "50")),
+            slow_query_log=os.getenv("DB_SLOW_QUERY_LOG")
+        ) if instrument else None
+        
+        self.pool = ConnectionPool(
+            db_path, max_idle=pool_size, busy_timeout_ms=busy_timeout_ms, query_stats=self.query_stats
+        )
         self.init_database()
+        
+        # Chat activity is written synchronously unless write-behind is enabled
+        if write_behind is None:
+            write_behind = os.getenv("DB_WRITE_BEHIND") == "1"
+        self.chat_buffer = self._open_chat_buffer(flush_interval, flush_size) if write_behind else None
+    
+    def _open_chat_buffer(self, flush_interval, flush_size):
+        """Join the database file's write-behind buffer, starting it if this is its first manager"""
+        with _chat_buffers_lock:
+            entry = _chat_buffers.get(self.db_path)
+            if entry is None:
+                entry = _chat_buffers[self.db_path] = [ChatWriteBuffer(self, flush_interval, flush_size), 0]
+            entry[1] += 1
+            return entry[0]
+    
+    def close(self):
+        """Flush buffered writes and release the pooled connections"""
+        if self.chat_buffer:
+            with _chat_buffers_lock:
+                entry = _chat_buffers[self.db_path]
+                entry[1] -= 1
+                last = entry[1] == 0
+                if last:
+                    del _chat_buffers[self.db_path]
+            # Other managers still using the buffer keep it running
+            if last:
+                self.chat_buffer.close()
+            else:
+                self.chat_buffer.flush()
+            self.chat_buffer = None
+        self.pool.close()
     
     def init_database(self):
-        """Initialize the database with required tables"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        # Users table
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS users (
-                user_id TEXT PRIMARY KEY,
-                username TEXT UNIQUE NOT NULL,
-                email TEXT UNIQUE NOT NULL,
-                password_hash TEXT NOT NULL,
-                full_name TEXT,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                last_active TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        ''')
-        
-        # Progress table
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS progress (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id TEXT,
-                subject TEXT,
-                topic TEXT,
-                completed BOOLEAN DEFAULT FALSE,
-                best_score REAL DEFAULT 0,
-                chat_count INTEGER DEFAULT 0,
-                last_updated TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (user_id) REFERENCES users (user_id)
-            )
-        ''')
-        
-        # Quiz attempts table
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS quiz_attempts (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id TEXT,
-                subject TEXT,
-                topic TEXT,
-                score REAL,
-                questions_data TEXT,
-                answers_data TEXT,
-                attempt_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (user_id) REFERENCES users (user_id)
-            )
-        ''')
-        
-        # Chat sessions table
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS chat_sessions (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id TEXT,
-                subject TEXT,
-                topic TEXT,
-                message_count INTEGER DEFAULT 0,
-                session_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (user_id) REFERENCES users (user_id)
-            )
-        ''')
-        
-        conn.commit()
-        conn.close()
+        """Bring the database schema up to date, skipping all DDL when it is current"""
+        with _migrated_lock:
+            if self.db_path in _migrated_paths:
+                return
+            
+            with self.pool.connection() as conn:
+                current = migrations.schema_version(conn)
+            
+            if current < migrations.SCHEMA_VERSION:
+                # Another process may be migrating too; migrate re-reads the
+                # version once the write lock is held
+                with self.pool.connection(immediate=True) as conn:
+                    migrations.migrate(conn)
+            
+            _migrated_paths.add(self.db_path)
+    
+    def _is_known_user(self, user_id):
+        with _known_users_lock:
+            return user_id in _known_users.get(self.db_path, ())
+    
+    def _remember_user(self, user_id):
+        with _known_users_lock:
+            _known_users.setdefault(self.db_path, set()).add(user_id)
+    
+    def _insert_legacy_user(self, cursor, user_id):
+        """Create a legacy user for backward compatibility, if missing"""
+        cursor.execute(
+            'INSERT OR IGNORE INTO users (user_id, username, email, password_hash) VALUES (?, ?, ?, ?)',
+            (user_id, f'guest_{user_id[:8]}', f'{user_id}@guest.local', 'legacy')
+        )
     
     def ensure_user_exists(self, user_id):
         """Ensure user exists in database (legacy support)"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        cursor.execute('SELECT user_id FROM users WHERE user_id = ?', (user_id,))
-        if not cursor.fetchone():
-            # Create a legacy user for backward compatibility
-            cursor.execute(
-                'INSERT OR IGNORE INTO users (user_id, username, email, password_hash) VALUES (?, ?, ?, ?)',
-                (user_id, f'guest_{user_id[:8]}', f'{user_id}@guest.local', 'legacy')
-            )
+        if self._is_known_user(user_id):
+            return
         
-        conn.commit()
-        conn.close()
+        with self.pool.connection() as conn:
+            self._insert_legacy_user(conn.cursor(), user_id)
+            self.pool.on_commit(lambda: self._remember_user(user_id))
+    
+    @contextmanager
+    def profile(self, label):
+        """Count the queries issued on this thread inside the block when instrumentation is on"""
+        if not self.query_stats:
+            yield None
+            return
+        
+        with self.query_stats.scope(label) as scope:
+            yield scope
+    
+    @contextmanager
+    def transaction(self):
+        """Run several DatabaseManager calls as one unit of work
+        
+            with db.transaction() as tx:
+                tx.update_progress(...)
+                tx.save_quiz_attempt(...)
+        
+        Every call made on this thread inside the block shares one connection
+        and commits once at the end, or rolls back together on error.
+        """
+        with self.pool.connection(immediate=True):
+            yield self
+    
+    @contextmanager
+    def _user_write(self, user_id):
+        """Open a write on behalf of a user, creating the legacy user row on first sight"""
+        known = self._is_known_user(user_id)
+        
+        with self.pool.connection() as conn:
+            cursor = conn.cursor()
+            if not known:
+                self._insert_legacy_user(cursor, user_id)
+                # Only cache the user once the row is committed
+                self.pool.on_commit(lambda: self._remember_user(user_id))
+            yield cursor
+    
+    def _apply_pending_chats(self, user_id, progress):
+        """Add chat counts still waiting in the write-behind buffer to a subject -> topic progress dict"""
+        if not self.chat_buffer:
+            return progress
+        
+        for (subject, topic), count in self.chat_buffer.pending_for(user_id).items():
+            entry = progress.setdefault(subject, {}).setdefault(topic, {
+                'completed': False,
+                'best_score': 0,
+                'chat_count': 0
+            })
+            entry['chat_count'] += count
+        
+        return progress
     
     def get_user_progress(self, user_id, subject):
         """Get user progress for a specific subject"""
-        self.ensure_user_exists(user_id)
-        
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
+        with self.pool.connection() as conn:
+            cursor = conn.cursor()
         
-        cursor.execute('''
-            SELECT topic, completed, best_score, chat_count
-            FROM progress
-            WHERE user_id = ? AND subject = ?
-        ''', (user_id, subject))
+            cursor.execute('''
+                SELECT topic, completed, best_score, chat_count
+                FROM progress
+                WHERE user_id = ? AND subject = ?
+            ''', (user_id, subject))
         
-        results = cursor.fetchall()
-        conn.close()
+            results = cursor.fetchall()
         
         progress = {}
         for topic, completed, best_score, chat_count in results:
@@ -114,186 +395,336 @@ class DatabaseManager:
                 'chat_count': chat_count
             }
         
+        if self.chat_buffer:
+            progress = self._apply_pending_chats(user_id, {subject: progress}).get(subject, {})
+        
         return progress
     
+    def get_all_progress(self, user_id):
+        """Get user progress for every subject in one query
+        
+        Returns a dict of subject -> topic -> progress, shaped like
+        get_user_progress for each subject. Subjects without progress are absent.
+        """
+        with self.pool.connection() as conn:
+            cursor = conn.cursor()
+            
+            cursor.execute('''
+                SELECT subject, topic, completed, best_score, chat_count
+                FROM progress
+                WHERE user_id = ?
+            ''', (user_id,))
+            
+            results = cursor.fetchall()
+        
+        progress = {}
+        for subject, topic, completed, best_score, chat_count in results:
+            progress.setdefault(subject, {})[topic] = {
+                'completed': bool(completed),
+                'best_score': best_score,
+                'chat_count': chat_count
+            }
+        
+        return self._apply_pending_chats(user_id, progress)
+    
     def get_topic_progress(self, user_id, subject, topic):
         """Get progress for a specific topic"""
-        self.ensure_user_exists(user_id)
-        
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
+        with self.pool.connection() as conn:
+            cursor = conn.cursor()
         
-        cursor.execute('''
-            SELECT completed, best_score, chat_count
-            FROM progress
-            WHERE user_id = ? AND subject = ? AND topic = ?
-        ''', (user_id, subject, topic))
+            cursor.execute('''
+                SELECT completed, best_score, chat_count
+                FROM progress
+                WHERE user_id = ? AND subject = ? AND topic = ?
+            ''', (user_id, subject, topic))
         
-        result = cursor.fetchone()
-        conn.close()
+            result = cursor.fetchone()
         
         if result:
             completed, best_score, chat_count = result
-            return {
+            progress = {
                 'completed': bool(completed),
                 'best_score': best_score,
                 'chat_count': chat_count
             }
         else:
-            return {
+            progress = {
                 'completed': False,
                 'best_score': 0,
                 'chat_count': 0
             }
+        
+        if self.chat_buffer:
+            progress['chat_count'] += self.chat_buffer.pending_for(user_id).get((subject, topic), 0)
+        
+        return progress
     
     def update_progress(self, user_id, subject, topic, **kwargs):
         """Update progress for a specific topic"""
-        self.ensure_user_exists(user_id)
-        
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        # Check if progress record exists
-        cursor.execute('''
-            SELECT id FROM progress
-            WHERE user_id = ? AND subject = ? AND topic = ?
-        ''', (user_id, subject, topic))
-        
-        if cursor.fetchone():
-            # Update existing record
-            set_clauses = []
-            values = []
-            
-            for key, value in kwargs.items():
-                if key in ['completed', 'best_score', 'chat_count']:
-                    set_clauses.append(f'{key} = ?')
-                    values.append(value)
-            
-            if set_clauses:
-                set_clauses.append('last_updated = CURRENT_TIMESTAMP')
-                values.extend([user_id, subject, topic])
-                
-                cursor.execute(f'''
-                    UPDATE progress
-                    SET {', '.join(set_clauses)}
-                    WHERE user_id = ? AND subject = ? AND topic = ?
-                ''', values)
+        fields = {key: value for key, value in kwargs.items() if key in PROGRESS_FIELDS}
+        
+        # Only the supplied fields are overwritten on conflict; a new row
+        # takes the defaults for everything else
+        if fields:
+            assignments = [f'{key} = excluded.{key}' for key in fields]
+            assignments.append('last_updated = CURRENT_TIMESTAMP')
+            on_conflict = f"DO UPDATE SET {', '.join(assignments)}"
         else:
-            # Insert new record
-            cursor.execute('''
+            on_conflict = 'DO NOTHING'
+        
+        with self._user_write(user_id) as cursor:
+            cursor.execute(f'''
                 INSERT INTO progress (user_id, subject, topic, completed, best_score, chat_count)
                 VALUES (?, ?, ?, ?, ?, ?)
+                ON CONFLICT (user_id, subject, topic) {on_conflict}
             ''', (
                 user_id, subject, topic,
-                kwargs.get('completed', False),
-                kwargs.get('best_score', 0),
-                kwargs.get('chat_count', 0)
+                fields.get('completed', False),
+                fields.get('best_score', 0),
+                fields.get('chat_count', 0)
             ))
-        
-        conn.commit()
-        conn.close()
     
     def save_quiz_attempt(self, user_id, subject, topic, score, questions_data, answers_data):
         """Save a quiz attempt"""
-        self.ensure_user_exists(user_id)
-        
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            INSERT INTO quiz_attempts (user_id, subject, topic, score, questions_data, answers_data)
-            VALUES (?, ?, ?, ?, ?, ?)
-        ''', (
-            user_id, subject, topic, score,
-            json.dumps(questions_data),
-            json.dumps(answers_data)
-        ))
-        
-        conn.commit()
-        conn.close()
+        with self._user_write(user_id) as cursor:
+            cursor.execute('''
+                INSERT INTO quiz_attempts (user_id, subject, topic, score, questions_data, answers_data)
+                VALUES (?, ?, ?, ?, ?, ?)
+            ''', (
+                user_id, subject, topic, score,
+                json.dumps(questions_data),
+                json.dumps(answers_data)
+            ))
     
     def save_chat_session(self, user_id, subject, topic, message_count):
         """Save a chat session"""
-        self.ensure_user_exists(user_id)
+        with self._user_write(user_id) as cursor:
+            cursor.execute('''
+                INSERT INTO chat_sessions (user_id, subject, topic, message_count)
+                VALUES (?, ?, ?, ?)
+            ''', (user_id, subject, topic, message_count))
+    
+    def record_chat_activity(self, user_id, subject, topic, message_count=1):
+        """Increment a topic's chat count and log the chat session in one transaction
         
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
+        With write-behind enabled the increment is queued and written later in a batch.
+        """
+        if self.chat_buffer:
+            self.chat_buffer.add(user_id, subject, topic, message_count)
+            return
+        
+        with self._user_write(user_id) as cursor:
+            cursor.execute('''
+                INSERT INTO progress (user_id, subject, topic, chat_count)
+                VALUES (?, ?, ?, ?)
+                ON CONFLICT (user_id, subject, topic) DO UPDATE SET
+                    chat_count = chat_count + excluded.chat_count,
+                    last_updated = CURRENT_TIMESTAMP
+            ''', (user_id, subject, topic, message_count))
+            
+            cursor.execute('''
+                INSERT INTO chat_sessions (user_id, subject, topic, message_count)
+                VALUES (?, ?, ?, ?)
+            ''', (user_id, subject, topic, message_count))
+    
+    def _write_chat_batch(self, batch, on_commit=None):
+        """Apply coalesced chat counts, keyed by (user_id, subject, topic), in one transaction
         
-        cursor.execute('''
-            INSERT INTO chat_sessions (user_id, subject, topic, message_count)
-            VALUES (?, ?, ?, ?)
-        ''', (user_id, subject, topic, message_count))
+        on_commit, if given, is called as soon as the transaction commits.
+        """
+        rows = [(user_id, subject, topic, count) for (user_id, subject, topic), count in batch.items()]
+        new_users = {user_id for user_id, _, _, _ in rows if not self._is_known_user(user_id)}
         
-        conn.commit()
-        conn.close()
+        with self.pool.connection() as conn:
+            if on_commit is not None:
+                self.pool.on_commit(on_commit)
+            
+            cursor = conn.cursor()
+            for user_id in new_users:
+                self._insert_legacy_user(cursor, user_id)
+            
+            cursor.executemany('''
+                INSERT INTO progress (user_id, subject, topic, chat_count)
+                VALUES (?, ?, ?, ?)
+                ON CONFLICT (user_id, subject, topic) DO UPDATE SET
+                    chat_count = chat_count + excluded.chat_count,
+                    last_updated = CURRENT_TIMESTAMP
+            ''', rows)
+            
+            cursor.executemany('''
+                INSERT INTO chat_sessions (user_id, subject, topic, message_count)
+                VALUES (?, ?, ?, ?)
+            ''', rows)
+            
+            for user_id in new_users:
+                self.pool.on_commit(lambda user_id=user_id: self._remember_user(user_id))
+    
+    def record_quiz_attempt(self, user_id, subject, topic, score, completed, questions_data, answers_data):
+        """Fold a quiz score into the topic's progress and save the attempt in one transaction
+        
+        The best score only ever goes up and a completed topic stays completed,
+        so concurrent submissions cannot overwrite each other.
+        Returns the id of the new quiz attempt.
+        """
+        with self._user_write(user_id) as cursor:
+            cursor.execute('''
+                INSERT INTO progress (user_id, subject, topic, completed, best_score)
+                VALUES (?, ?, ?, ?, ?)
+                ON CONFLICT (user_id, subject, topic) DO UPDATE SET
+                    best_score = MAX(best_score, excluded.best_score),
+                    completed = completed OR excluded.completed,
+                    last_updated = CURRENT_TIMESTAMP
+            ''', (user_id, subject, topic, bool(completed), score))
+            
+            cursor.execute('''
+                INSERT INTO quiz_attempts (user_id, subject, topic, score, questions_data, answers_data)
+                VALUES (?, ?, ?, ?, ?, ?)
+            ''', (
+                user_id, subject, topic, score,
+                json.dumps(questions_data),
+                json.dumps(answers_data)
+            ))
+            
+            return cursor.lastrowid
     
     def get_quiz_history(self, user_id, subject, topic=None):
         """Get quiz history for a user"""
-        self.ensure_user_exists(user_id)
+        with self.pool.connection() as conn:
+            cursor = conn.cursor()
         
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
+            if topic:
+                cursor.execute('''
+                    SELECT score, attempt_date
+                    FROM quiz_attempts
+                    WHERE user_id = ? AND subject = ? AND topic = ?
+                    ORDER BY attempt_date DESC
+                ''', (user_id, subject, topic))
+            else:
+                cursor.execute('''
+                    SELECT topic, score, attempt_date
+                    FROM quiz_attempts
+                    WHERE user_id = ? AND subject = ?
+                    ORDER BY attempt_date DESC
+                ''', (user_id, subject))
+        
+            results = cursor.fetchall()
         
-        if topic:
+        return results
+    
+    def get_latest_quiz_attempt(self, user_id, subject, topic):
+        """Get the student's most recent attempt at a topic's quiz, or None"""
+        with self.pool.connection() as conn:
+            cursor = conn.cursor()
             cursor.execute('''
-                SELECT score, attempt_date
+                SELECT id, score, attempt_date, recommendations
                 FROM quiz_attempts
                 WHERE user_id = ? AND subject = ? AND topic = ?
-                ORDER BY attempt_date DESC
+                ORDER BY attempt_date DESC, id DESC
+                LIMIT 1
             ''', (user_id, subject, topic))
-        else:
-            cursor.execute('''
-                SELECT topic, score, attempt_date
-                FROM quiz_attempts
-                WHERE user_id = ? AND subject = ?
-                ORDER BY attempt_date DESC
-            ''', (user_id, subject))
-        
-        results = cursor.fetchall()
-        conn.close()
+            
+            result = cursor.fetchone()
         
-        return results
+        if result:
+            return {
+                'attempt_id': result[0],
+                'score': result[1],
+                'attempt_date': result[2],
+                'recommendations': result[3]
+            }
+        return None
     
+    def save_quiz_recommendations(self, attempt_id, recommendations):
+        """Store the recommendations generated for a quiz attempt"""
+        with self.pool.connection() as conn:
+            conn.execute(
+                'UPDATE quiz_attempts SET recommendations = ? WHERE id = ?',
+                (recommendations, attempt_id)
+            )
+    
+    def get_quiz_recommendations(self, attempt_id):
+        """Get the stored recommendations for a quiz attempt, or None if there are none yet"""
+        with self.pool.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('SELECT recommendations FROM quiz_attempts WHERE id = ?', (attempt_id,))
+            result = cursor.fetchone()
+        
+        return result[0] if result else None
+    
+    def add_pooled_quiz(self, subject, topic, difficulty, num_questions, quiz_data):
+        """Store a ready-made quiz in the pool for its subject, topic and difficulty"""
+        with self.pool.connection() as conn:
+            conn.execute('''
+                INSERT INTO quiz_pool (subject, topic, difficulty, num_questions, quiz_data)
+                VALUES (?, ?, ?, ?, ?)
+            ''', (subject, topic, difficulty, num_questions, json.dumps(quiz_data)))
+    
+    def take_pooled_quiz(self, subject, topic, difficulty, num_questions):
+        """Remove and return the oldest pooled quiz, or None when the pool is empty"""
+        # Taking the write lock up front means two students never get the same quiz
+        with self.pool.connection(immediate=True) as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                SELECT id, quiz_data FROM quiz_pool
+                WHERE subject = ? AND topic = ? AND difficulty = ? AND num_questions = ?
+                ORDER BY id
+                LIMIT 1
+            ''', (subject, topic, difficulty, num_questions))
+        
+            row = cursor.fetchone()
+            if not row:
+                return None
+            cursor.execute('DELETE FROM quiz_pool WHERE id = ?', (row[0],))
+        
+        return json.loads(row[1])
+    
+    def count_pooled_quizzes(self, subject, topic, difficulty, num_questions):
+        """Count the quizzes waiting in a pool"""
+        with self.pool.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute('''
+                SELECT COUNT(*) FROM quiz_pool
+                WHERE subject = ? AND topic = ? AND difficulty = ? AND num_questions = ?
+            ''', (subject, topic, difficulty, num_questions))
+            return cursor.fetchone()[0]
+        
     def create_user(self, username, email, password, full_name=None):
         """Create a new user account"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
-        
         try:
             # Generate user ID and hash password
             user_id = str(uuid.uuid4())
             password_hash = hashlib.sha256(password.encode()).hexdigest()
             
-            cursor.execute('''
-                INSERT INTO users (user_id, username, email, password_hash, full_name)
-                VALUES (?, ?, ?, ?, ?)
-            ''', (user_id, username, email, password_hash, full_name))
+            with self.pool.connection() as conn:
+                cursor = conn.cursor()
+                cursor.execute('''
+                    INSERT INTO users (user_id, username, email, password_hash, full_name)
+                    VALUES (?, ?, ?, ?, ?)
+                ''', (user_id, username, email, password_hash, full_name))
             
-            conn.commit()
-            conn.close()
+            self._remember_user(user_id)
             return user_id
             
         except sqlite3.IntegrityError:
-            conn.close()
             return None
     
     def authenticate_user(self, username, password):
         """Authenticate user login"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
+        with self.pool.connection() as conn:
+            cursor = conn.cursor()
         
-        password_hash = hashlib.sha256(password.encode()).hexdigest()
+            password_hash = hashlib.sha256(password.encode()).hexdigest()
         
-        cursor.execute('''
-            SELECT user_id, username, email, full_name
-            FROM users
-            WHERE username = ? AND password_hash = ?
-        ''', (username, password_hash))
+            cursor.execute('''
+                SELECT user_id, username, email, full_name
+                FROM users
+                WHERE username = ? AND password_hash = ?
+            ''', (username, password_hash))
         
-        result = cursor.fetchone()
-        conn.close()
+            result = cursor.fetchone()
         
         if result:
+            self._remember_user(result[0])
             return {
                 'user_id': result[0],
                 'username': result[1],
@@ -304,17 +735,16 @@ class DatabaseManager:
     
     def get_user_by_username(self, username):
         """Get user info by username"""
-        conn = sqlite3.connect(self.db_path)
-        cursor = conn.cursor()
+        with self.pool.connection() as conn:
+            cursor = conn.cursor()
         
-        cursor.execute('''
-            SELECT user_id, username, email, full_name, created_at
-            FROM users
-            WHERE username = ?
-        ''', (username,))
+            cursor.execute('''
+                SELECT user_id, username, email, full_name, created_at
+                FROM users
+                WHERE username = ?
+            ''', (username,))
         
-        result = cursor.fetchone()
-        conn.close()
+            result = cursor.fetchone()
         
         if result:
             return {
@@ -0,0 +1,57 @@
+"""
+Request hedging for interactive routes
+
+A few model calls take many times longer than the median. When a hedged
+route's request has not answered by a high percentile of that route's recent
+latency, the gateway sends a duplicate (to the same model or the route's
+fallback), uses whichever answers first and cancels the other. The extra
+load is capped by a budget: every request earns `budget` of a hedge, so at
+budget=0.05 at most about one request in twenty is duplicated, however slow
+the upstream gets.
+"""
+import threading
+from collections import deque
+
+class HedgePolicy:
+    def __init__(self, percentile=95, budget=0.05, window=200, min_samples=20, to_fallback=False,
+                 max_credit=10.0):
+        self.percentile = percentile
+        self.budget = budget
+        self.window = window
+        self.min_samples = min_samples
+        self.to_fallback = to_fallback
+        self.max_credit = max_credit
+
+        # key -> recent latencies in milliseconds
+        self._latencies = {}
+        self._credit = 0.0
+        self.hedges = 0
+        self._lock = threading.Lock()
+
+    def record(self, key, latency_ms):
+        """Add the latency a caller saw to a key's window, e.g. a route's"""
+        with self._lock:
+            latencies = self._latencies.get(key)
+            if latencies is None:
+                latencies = self._latencies[key] = deque(maxlen=self.window)
+            latencies.append(latency_ms)
+
+    def delay(self, key):
+        """Count a request and get how long to wait before hedging it, or None without enough history"""
+        with self._lock:
+            self._credit = min(self.max_credit, self._credit + self.budget)
+            latencies = self._latencies.get(key)
+            if latencies is None or len(latencies) < self.min_samples:
+                return None
+            ordered = sorted(latencies)
+        index = min(len(ordered) - 1, int(len(ordered) * self.percentile / 100))
+        return ordered[index] / 1000
+
+    def try_spend(self):
+        """Take one hedge from the budget, returning False when it is used up"""
+        with self._lock:
+            if self._credit < 1:
+                return False
+            self._credit -= 1
+            self.hedges += 1
+            return True
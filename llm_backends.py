@@ -0,0 +1,188 @@
+"""
+Backends the gateway sends model calls to
+
+A backend has two coroutines: generate(model, contents, config) returns a
+GenerateContentResponse and stream(model, contents, config) returns an async
+iterator of response chunks. GeminiBackend calls the real service.
+FakeBackend is a local stand-in for working offline. It answers every model
+with canned tutor text and schema-valid quizzes. Its timing follows a
+log-normal time to first token plus a steady token rate, its token usage is
+reported like Gemini's, and it can fail a share of calls with the same
+transient API errors the gateway retries. LLM_BACKEND=fake selects it.
+"""
+import asyncio
+import json
+import math
+import os
+import random
+import re
+from google import genai
+from google.genai import errors, types
+
+class GeminiBackend:
+    def __init__(self, api_key=None, timeout_seconds=120):
+        self.client = genai.Client(
+            api_key=api_key or os.getenv("GEMINI_API_KEY"),
+            http_options=types.HttpOptions(timeout=int(timeout_seconds * 1000))
+        )
+
+    async def generate(self, model, contents, config=None):
+        return await self.client.aio.models.generate_content(
+            model=model,
+            contents=contents,
+            config=config
+        )
+
+    async def stream(self, model, contents, config=None):
+        return await self.client.aio.models.generate_content_stream(
+            model=model,
+            contents=contents,
+            config=config
+        )
+
+# Statuses FakeBackend fails with, all of which the gateway retries
+FAKE_ERRORS = [
+    (429, "RESOURCE_EXHAUSTED", errors.ClientError),
+    (500, "INTERNAL", errors.ServerError),
+    (503, "UNAVAILABLE", errors.ServerError),
+]
+
+def _prompt_text(contents):
+    """Get the text of a call's contents"""
+    if isinstance(contents, str):
+        return contents
+    texts = []
+    for content in contents:
+        if isinstance(content, str):
+            texts.append(content)
+        else:
+            texts.extend(part.text or "" for part in content.parts or [])
+    return "\n".join(texts)
+
+class FakeBackend:
+    def __init__(self, latency_ms=800, latency_p99_ms=4000, tokens_per_second=150, chunk_tokens=20,
+                 output_tokens=300, error_rate=0.0, model_latency=None, seed=None):
+        # Time to first token is log-normal with this median and p99
+        self.latency_ms = latency_ms
+        self.latency_p99_ms = max(latency_p99_ms, latency_ms)
+        # Output is produced at tokens_per_second and streamed chunk_tokens at a time
+        self.tokens_per_second = tokens_per_second
+        self.chunk_tokens = chunk_tokens
+        self.output_tokens = output_tokens
+        self.error_rate = error_rate
+        # model -> multiplier on the latency, e.g. slower pro models
+        self.model_latency = model_latency or {}
+        self.random = random.Random(seed)
+
+    @classmethod
+    def from_env(cls):
+        """Build a fake backend from LLM_FAKE_* environment variables
+
+        LLM_FAKE_LATENCY_SCALES="gemini-2.5-pro=3,gemini-2.5-flash-lite=0.5"
+        makes some models slower or faster than LLM_FAKE_LATENCY_MS.
+        """
+        model_latency = {}
+        for item in os.getenv("LLM_FAKE_LATENCY_SCALES", "").split(","):
+            model, _, scale = item.partition("=")
+            if scale:
+                model_latency[model.strip()] = float(scale)
+        seed = os.getenv("LLM_FAKE_SEED")
+        return cls(
+            latency_ms=float(os.getenv("LLM_FAKE_LATENCY_MS", "800")),
+            latency_p99_ms=float(os.getenv("LLM_FAKE_LATENCY_P99_MS", "4000")),
+            tokens_per_second=float(os.getenv("LLM_FAKE_TOKENS_PER_SECOND", "150")),
+            chunk_tokens=int(os.getenv("LLM_FAKE_CHUNK_TOKENS", "20")),
+            output_tokens=int(os.getenv("LLM_FAKE_OUTPUT_TOKENS", "300")),
+            error_rate=float(os.getenv("LLM_FAKE_ERROR_RATE", "0")),
+            model_latency=model_latency,
+            seed=int(seed) if seed else None
+        )
+
+    def _first_token_seconds(self, model):
+        """Sample the time to first token for a call"""
+        # z of the 99th percentile, so that the sampled p99 matches
+        sigma = math.log(self.latency_p99_ms / self.latency_ms) / 2.326
+        sample = self.random.lognormvariate(math.log(self.latency_ms), sigma)
+        return sample * self.model_latency.get(model, 1.0) / 1000
+
+    def _maybe_fail(self):
+        if self.random.random() < self.error_rate:
+            code, status, error = self.random.choice(FAKE_ERRORS)
+            raise error(code, {"error": {"code": code, "message": "Injected by FakeBackend", "status": status}})
+
+    def _quiz(self, prompt):
+        """Build a quiz in the format QuizEngine asks for, sized and titled from its prompt"""
+        match = re.search(r"(\d+)-question multiple choice quiz about (.+?) in (.+?)\.", prompt)
+        num_questions, topic, subject = (int(match.group(1)), match.group(2), match.group(3)) if match else (5, "the topic", "the subject")
+        difficulties = ["easy", "medium", "hard"]
+        questions = []
+        for i in range(num_questions):
+            answer = self.random.randrange(4)
+            questions.append({
+                "question": f"Practice question {i + 1} about {topic} in {subject}?",
+                "options": [f"Option {letter}" for letter in "ABCD"],
+                "correct_answer": answer,
+                "explanation": f"Option {'ABCD'[answer]} is the simulated correct answer.",
+                "difficulty": difficulties[i % 3]
+            })
+        return {"title": f"{topic} Quiz", "questions": questions}
+
+    def _text(self):
+        """Build tutor text of about output_tokens tokens"""
+        sentence = "This is a simulated tutor reply used for offline testing. "
+        # Roughly four characters to a token
+        return (sentence * (self.output_tokens * 4 // len(sentence) + 1))[:self.output_tokens * 4]
+
+    def _reply(self, contents, config):
+        prompt = _prompt_text(contents)
+        if config is not None and getattr(config, "response_mime_type", None) == "application/json":
+            text = json.dumps(self._quiz(prompt))
+        else:
+            text = self._text()
+        return text, len(prompt) // 4
+
+    @staticmethod
+    def _response(text, prompt_tokens, output_tokens):
+        return types.GenerateContentResponse(
+            candidates=[types.Candidate(content=types.Content(role="model", parts=[types.Part(text=text)]))],
+            usage_metadata=types.GenerateContentResponseUsageMetadata(
+                prompt_token_count=prompt_tokens,
+                candidates_token_count=output_tokens,
+                total_token_count=prompt_tokens + output_tokens
+            )
+        )
+
+    async def generate(self, model, contents, config=None):
+        text, prompt_tokens = self._reply(contents, config)
+        output_tokens = max(1, len(text) // 4)
+        await asyncio.sleep(self._first_token_seconds(model))
+        self._maybe_fail()
+        await asyncio.sleep(output_tokens / self.tokens_per_second)
+        return self._response(text, prompt_tokens, output_tokens)
+
+    async def stream(self, model, contents, config=None):
+        text, prompt_tokens = self._reply(contents, config)
+        first_token_seconds = self._first_token_seconds(model)
+
+        async def chunks():
+            await asyncio.sleep(first_token_seconds)
+            self._maybe_fail()
+            step = self.chunk_tokens * 4
+            pieces = [text[i:i + step] for i in range(0, len(text), step)]
+            for i, piece in enumerate(pieces):
+                if i:
+                    await asyncio.sleep(self.chunk_tokens / self.tokens_per_second)
+                # Like Gemini, the usage so far rides along with each chunk
+                output_tokens = max(1, (i * step + len(piece)) // 4)
+                yield self._response(piece, prompt_tokens, output_tokens)
+
+        return chunks()
+
+def backend_from_env(timeout_seconds=120):
+    """Build the backend LLM_BACKEND names: gemini (the default) or fake"""
+    name = os.getenv("LLM_BACKEND", "gemini")
+    if name == "fake":
+        return FakeBackend.from_env()
+    if name != "gemini":
+        raise ValueError(f"Unknown LLM_BACKEND {name!r}, expected gemini or fake")
+    return GeminiBackend(timeout_seconds=timeout_seconds)
@@ -0,0 +1,606 @@
+"""
+Process-wide gateway to the Gemini API
+
+TutorEngine and QuizEngine both delegate their model calls here, so the
+whole process shares one genai.Client (and with it one pool of keep-alive
+HTTP connections and TLS sessions) no matter how many pages or engines are
+created. The client sits behind a backend (see llm_backends.py), which
+LLM_BACKEND=fake swaps for a local stand-in. This is also the one place
+that knows which model serves each engine method (see model_router.py),
+request timeouts and how many generations may run at once.
+
+Generation is asynchronous underneath: the gateway runs its own event loop
+on a background thread and every request executes there on the backend's
+async client, under one concurrency limit. Async callers on any event loop (a
+future API server, say) await agenerate/astream; blocking callers such as
+Streamlit scripts use run/iterate or the generate/generate_stream shortcuts.
+
+Identical requests in flight at the same time (a class opening the same
+topic together) are coalesced into one call whose response every caller
+shares.
+
+Transient failures are retried with jittered backoff, and a per-model
+circuit breaker makes calls fail fast while a model is browned out (see
+resilience.py). Interactive routes can also hedge slow requests with a
+duplicate call, within a budget (see hedging.py). Calls can be held to
+per-model request and token quotas, queueing briefly when over them (see
+rate_limiter.py).
+"""
+import asyncio
+import concurrent.futures
+import hashlib
+import os
+import queue
+import threading
+import time
+from contextlib import asynccontextmanager, contextmanager
+from hedging import HedgePolicy
+from llm_backends import GeminiBackend, backend_from_env
+from model_router import ModelRouter
+from rate_limiter import RateLimiter
+from scheduler import Preempted, PriorityScheduler
+from resilience import CircuitBreaker, CircuitOpen, RetryPolicy, is_transient
+
+# Marks the end of a relayed stream
+_DONE = object()
+
+class DeadlineExceeded(TimeoutError):
+    """A generation ran past its route's timeout or the caller's deadline"""
+
+def deadline_in(seconds):
+    """Get the deadline for something that must finish within seconds from now"""
+    return time.monotonic() + seconds
+
+def _total_tokens(response):
+    """Get the tokens a response reports using, or None when it does not say"""
+    usage = getattr(response, "usage_metadata", None)
+    return getattr(usage, "total_token_count", None)
+
+class LLMGateway:
+    def __init__(self, api_key=None, router=None, timeout_seconds=120, max_concurrency=16,
+                 single_flight=True, retry=None, breaker_failures=5, breaker_reset_seconds=30.0,
+                 hedging=None, rate_limiter=None, scheduler=None, backend=None):
+        self.router = router or ModelRouter()
+        # Calls are not rate limited unless a RateLimiter is given
+        self.rate_limiter = rate_limiter
+        # Hedging is off unless a HedgePolicy is given
+        self.hedging = hedging
+        self.retry = retry or RetryPolicy()
+        self.breaker_failures = breaker_failures
+        self.breaker_reset_seconds = breaker_reset_seconds
+        # model -> CircuitBreaker, created on first use
+        self._breakers = {}
+        self.timeout_seconds = timeout_seconds
+        self.max_concurrency = max_concurrency
+        self.single_flight = single_flight
+
+        # Where calls go: the Gemini service unless a backend is given
+        self.backend = backend or GeminiBackend(api_key, timeout_seconds)
+
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, name="llm-gateway", daemon=True)
+        self._thread.start()
+        # Bounds the generations in flight across every engine in the process
+        # and decides who goes first when they are all busy
+        self.scheduler = scheduler or PriorityScheduler(max_concurrency)
+        # request key -> [task, number of callers waiting on it]; gateway loop only
+        self._inflight = {}
+        self.coalesced_requests = 0
+        # Per-thread interrupt check for blocking waits, see interruptible
+        self._local = threading.local()
+
+    @classmethod
+    def from_env(cls):
+        """Build a gateway configured from LLM_* environment variables"""
+        router = ModelRouter.from_env()
+        max_concurrency = int(os.getenv("LLM_MAX_CONCURRENCY", "16"))
+        timeout_seconds = float(os.getenv("LLM_TIMEOUT_SECONDS", "120"))
+        models = {route[role] for route in router.routes.values() for role in ("primary", "fallback")}
+        return cls(
+            router=router,
+            backend=backend_from_env(timeout_seconds),
+            timeout_seconds=timeout_seconds,
+            max_concurrency=max_concurrency,
+            single_flight=os.getenv("LLM_SINGLE_FLIGHT", "1") != "0",
+            retry=RetryPolicy(
+                max_attempts=int(os.getenv("LLM_RETRY_ATTEMPTS", "3")),
+                base_seconds=float(os.getenv("LLM_RETRY_BASE_SECONDS", "0.5")),
+                max_seconds=float(os.getenv("LLM_RETRY_MAX_SECONDS", "8"))
+            ),
+            breaker_failures=int(os.getenv("LLM_BREAKER_FAILURES", "5")),
+            breaker_reset_seconds=float(os.getenv("LLM_BREAKER_RESET_SECONDS", "30")),
+            hedging=HedgePolicy(
+                percentile=float(os.getenv("LLM_HEDGE_PERCENTILE", "95")),
+                budget=float(os.getenv("LLM_HEDGE_BUDGET", "0.05")),
+                to_fallback=os.getenv("LLM_HEDGE_TO_FALLBACK") == "1"
+            ) if os.getenv("LLM_HEDGE") == "1" else None,
+            rate_limiter=RateLimiter.from_env(sorted(models)),
+            scheduler=PriorityScheduler(
+                max_concurrency,
+                preempt_queue_length=int(os.getenv("LLM_PREEMPT_QUEUE_LENGTH", "1"))
+            )
+        )
+
+    def model_for(self, route):
+        """Get the primary model of a route, e.g. tutor.explain_concept"""
+        return self.router.primary(route)
+
+    @staticmethod
+    def request_key(route, contents, config=None, priority=None):
+        """Hash everything that determines a response into a single-flight key
+
+        The priority class is part of it, so an interactive caller never ends
+        up waiting on background work that may be preempted.
+        """
+        return hashlib.sha256(f"{route}\0{priority}\0{contents!r}\0{config!r}".encode()).hexdigest()
+
+    def _attempt_deadline(self, route, deadline=None):
+        """When one attempt on a route must finish: its timeout, or the caller's deadline if sooner"""
+        attempt_deadline = time.monotonic() + self.router.timeout(route)
+        return attempt_deadline if deadline is None else min(attempt_deadline, deadline)
+
+    def breaker(self, model):
+        """Get a model's circuit breaker"""
+        breaker = self._breakers.get(model)
+        if breaker is None:
+            breaker = self._breakers.setdefault(model, CircuitBreaker(self.breaker_failures, self.breaker_reset_seconds))
+        return breaker
+
+    def circuit_states(self):
+        """Get the circuit state of every model that has been called"""
+        return {model: breaker.state for model, breaker in list(self._breakers.items())}
+
+    def _record(self, route, model, started, error=None):
+        """Report a finished attempt to the router and the model's circuit breaker"""
+        self.router.record(route, model, (time.perf_counter() - started) * 1000, ok=error is None)
+        # Only transient failures say the upstream is in trouble; a rejected
+        # request still shows it is answering
+        if error is not None and is_transient(error):
+            self.breaker(model).record_failure()
+        else:
+            self.breaker(model).record_success()
+
+    def _other_model(self, route, model):
+        """Get the route's other model: the fallback for its primary and the primary for its fallback"""
+        primary = self.router.primary(route)
+        return self.router.fallback(route) if model == primary else primary
+
+    def _available_model(self, route, model):
+        """Get model, or the route's other model when model's circuit is open; raises CircuitOpen if both are"""
+        if self.breaker(model).allow():
+            return model
+        other = self._other_model(route, model)
+        if other != model and self.breaker(other).allow():
+            return other
+        raise CircuitOpen(f"{model} is unavailable, try again in {self.breaker(model).retry_after():.0f}s")
+
+    def _retry_delay(self, error, model, retry_model, attempt, deadline):
+        """Get how long to back off before retrying a failed attempt, or None to give up
+
+        Any failure of the chosen model earns one attempt on retry_model;
+        after that only transient failures are retried.
+        """
+        if isinstance(error, Preempted):
+            # Retrying would just queue the background work again
+            return None
+        transient = is_transient(error)
+        if attempt + 1 >= self.retry.max_attempts or not (transient or model != retry_model):
+            return None
+        delay = self.retry.backoff(attempt) if transient else 0
+        if deadline is not None and time.monotonic() + delay >= deadline:
+            return None
+        return delay
+
+    # Work that runs on the gateway loop
+
+    async def _reserve(self, model, contents, deadline, priority):
+        """Queue for rate-limit capacity for a call, returning the tokens reserved"""
+        if self.rate_limiter is None:
+            return None
+        # Background work only uses quota that is free right now
+        max_wait = 0 if self.scheduler.preemptible(priority) else None
+        return await self.rate_limiter.acquire(model, contents, deadline, max_wait)
+
+    @asynccontextmanager
+    async def _slot(self, model, reserved, priority):
+        """Hold a scheduler slot for a call, giving its rate-limit reservation back if none is granted"""
+        try:
+            await self.scheduler.acquire(priority)
+        except BaseException:
+            # Preempted, or timed out or cancelled while queued: the call is
+            # never sent, so it must not keep the model's quota
+            if self.rate_limiter is not None:
+                await asyncio.shield(self.rate_limiter.refund(model, reserved))
+            raise
+        try:
+            yield
+        finally:
+            self.scheduler.release()
+
+    async def _settle(self, model, reserved, response):
+        """Charge a model's rate limit for the tokens a finished call really used"""
+        if self.rate_limiter is not None:
+            await self.rate_limiter.settle(model, reserved, _total_tokens(response))
+
+    async def _call(self, route, model, contents, config, deadline, priority):
+        attempt_deadline = self._attempt_deadline(route, deadline)
+        started = None
+        try:
+            # The loop clock is time.monotonic, so deadlines apply directly
+            async with asyncio.timeout_at(attempt_deadline):
+                reserved = await self._reserve(model, contents, attempt_deadline, priority)
+                async with self._slot(model, reserved, priority):
+                    started = time.perf_counter()
+                    response = await self.backend.generate(model, contents, config)
+                await self._settle(model, reserved, response)
+        except Exception as e:
+            if started is not None:
+                self._record(route, model, started, e)
+            if isinstance(e, TimeoutError):
+                raise DeadlineExceeded(f"{route} did not finish in time") from None
+            raise
+
+        self._record(route, model, started)
+        return response, model
+
+    def _hedging(self, route):
+        """Whether requests on a route are hedged"""
+        return self.hedging is not None and self.router.hedged(route)
+
+    def _hedge_model(self, model, fallback):
+        """Get the model a due hedge goes to, or None when the budget or its circuit rules it out"""
+        hedge_model = fallback if self.hedging.to_fallback else model
+        if self.hedging.try_spend() and self.breaker(hedge_model).allow():
+            return hedge_model
+        return None
+
+    async def _attempt(self, route, model, contents, config, deadline, priority):
+        """Make one call on a model, hedging it with a duplicate if it is slow to answer
+
+        Returns the response and the model that gave it.
+        """
+        if not self._hedging(route):
+            return await self._call(route, model, contents, config, deadline, priority)
+
+        delay = self.hedging.delay(route)
+        started = time.perf_counter()
+        tasks = {asyncio.ensure_future(self._call(route, model, contents, config, deadline, priority))}
+        try:
+            if delay is not None:
+                done, _ = await asyncio.wait(tasks, timeout=delay)
+                hedge_model = None if done else self._hedge_model(model, self.router.fallback(route))
+                if hedge_model is not None:
+                    tasks.add(asyncio.ensure_future(self._call(route, hedge_model, contents, config, deadline, priority)))
+
+            # The first success wins; the attempt only fails once every call has
+            error = None
+            while tasks:
+                done, tasks = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        self.hedging.record(route, (time.perf_counter() - started) * 1000)
+                        return task.result()
+                    error = error or task.exception()
+            raise error
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def _routed_call(self, route, contents, config, priority, deadline=None):
+        """Call the route's chosen model, retrying failures on the route's other model with backoff"""
+        model = self.router.choose(route)
+        # The router may have chosen the fallback, in which case retries go to the primary
+        retry_model = self._other_model(route, model)
+        attempt = 0
+        while True:
+            model = self._available_model(route, model)
+            try:
+                return await self._attempt(route, model, contents, config, deadline, priority)
+            except Exception as e:
+                delay = self._retry_delay(e, model, retry_model, attempt, deadline)
+                if delay is None:
+                    raise
+            await asyncio.sleep(delay)
+            model = retry_model
+            attempt += 1
+
+    async def _generate_on_loop(self, route, contents, config, coalesce, deadline, priority):
+        priority = priority or self.router.priority(route)
+        if not (self.single_flight and coalesce):
+            return await self._routed_call(route, contents, config, priority, deadline)
+
+        key = self.request_key(route, contents, config, priority)
+        entry = self._inflight.get(key)
+        if entry is None:
+            # The shared call is bounded by the route's timeouts; each caller
+            # applies its own deadline while waiting for it
+            task = asyncio.ensure_future(self._routed_call(route, contents, config, priority))
+            entry = self._inflight[key] = [task, 0]
+
+            def forget(_):
+                if self._inflight.get(key) is entry:
+                    del self._inflight[key]
+            task.add_done_callback(forget)
+        else:
+            self.coalesced_requests += 1
+
+        task = entry[0]
+        entry[1] += 1
+        try:
+            # Shielded so one caller giving up does not cancel the call for the others
+            async with asyncio.timeout_at(deadline):
+                return await asyncio.shield(task)
+        except TimeoutError:
+            if task.done():
+                raise
+            raise DeadlineExceeded(f"{route} did not finish in time") from None
+        finally:
+            entry[1] -= 1
+            if entry[1] == 0 and not task.done():
+                # Forget it before cancelling: the task takes a while to
+                # unwind, and a new caller must not join it meanwhile
+                if self._inflight.get(key) is entry:
+                    del self._inflight[key]
+                task.cancel()
+
+    async def _stream_model(self, route, model, contents, config, deadline, priority):
+        attempt_deadline = self._attempt_deadline(route, deadline)
+        started = None
+        try:
+            # Covers the whole reply; only this generator runs between chunks
+            async with asyncio.timeout_at(attempt_deadline):
+                reserved = await self._reserve(model, contents, attempt_deadline, priority)
+                chunk = None
+                async with self._slot(model, reserved, priority):
+                    started = time.perf_counter()
+                    stream = await self.backend.stream(model, contents, config)
+                    async for chunk in stream:
+                        yield chunk
+                # The last chunk carries the usage of the whole reply
+                await self._settle(model, reserved, chunk)
+        except Exception as e:
+            if started is not None:
+                self._record(route, model, started, e)
+            if isinstance(e, TimeoutError):
+                raise DeadlineExceeded(f"{route} did not finish in time") from None
+            raise
+
+        self._record(route, model, started)
+
+    async def _stream_attempt(self, route, model, contents, config, deadline, priority):
+        """Stream from a model, hedging with a duplicate stream if the first chunk is slow to arrive"""
+        if not self._hedging(route):
+            async for chunk in self._stream_model(route, model, contents, config, deadline, priority):
+                yield chunk
+            return
+
+        key = f"{route}:first_chunk"
+        delay = self.hedging.delay(key)
+        started = time.perf_counter()
+        # Each candidate stream is driven by a task of its own, so the
+        # timeout _stream_model enters stays with it for the whole reply,
+        # and hands (chunk, error) pairs over through a queue.
+        # chunk queue -> task driving its stream
+        pumps = {}
+
+        def start(candidate_model):
+            chunks = asyncio.Queue()
+            stream = self._stream_model(route, candidate_model, contents, config, deadline, priority)
+            pumps[chunks] = asyncio.ensure_future(self._pump(stream, chunks.put_nowait))
+            return chunks
+
+        # chunk queue -> task getting its first (chunk, error) pair
+        firsts = {}
+        chunks = start(model)
+        firsts[chunks] = asyncio.ensure_future(chunks.get())
+        winner = None
+        try:
+            if delay is not None:
+                done, _ = await asyncio.wait(firsts.values(), timeout=delay)
+                hedge_model = None if done else self._hedge_model(model, self.router.fallback(route))
+                if hedge_model is not None:
+                    chunks = start(hedge_model)
+                    firsts[chunks] = asyncio.ensure_future(chunks.get())
+
+            # The first stream to produce a chunk (or finish cleanly) wins
+            pending = dict(firsts)
+            error = None
+            while winner is None:
+                if not pending:
+                    raise error
+                done, _ = await asyncio.wait(pending.values(), return_when=asyncio.FIRST_COMPLETED)
+                for candidate, task in list(pending.items()):
+                    if task in done:
+                        del pending[candidate]
+                        if task.result()[1] is None:
+                            winner = candidate
+                            break
+                        error = error or task.result()[1]
+        finally:
+            for candidate, task in firsts.items():
+                if candidate is not winner:
+                    task.cancel()
+                    pumps[candidate].cancel()
+                    await asyncio.gather(task, pumps[candidate], return_exceptions=True)
+
+        self.hedging.record(key, (time.perf_counter() - started) * 1000)
+        try:
+            chunk, error = firsts[winner].result()
+            while chunk is not _DONE:
+                yield chunk
+                chunk, error = await winner.get()
+            if error is not None:
+                raise error
+        finally:
+            pumps[winner].cancel()
+            await asyncio.gather(pumps[winner], return_exceptions=True)
+
+    async def _stream_on_loop(self, route, contents, config, deadline, priority):
+        priority = priority or self.router.priority(route)
+        model = self.router.choose(route)
+        retry_model = self._other_model(route, model)
+        attempt = 0
+        while True:
+            model = self._available_model(route, model)
+            received = False
+            try:
+                async for chunk in self._stream_attempt(route, model, contents, config, deadline, priority):
+                    received = True
+                    yield chunk
+                return
+            except Exception as e:
+                # Retrying halfway through would garble the reply
+                delay = None if received else self._retry_delay(e, model, retry_model, attempt, deadline)
+                if delay is None:
+                    raise
+            await asyncio.sleep(delay)
+            model = retry_model
+            attempt += 1
+
+    async def _pump(self, agen, put):
+        """Drive an async generator on the gateway loop, handing (item, error) pairs to put"""
+        try:
+            async for item in agen:
+                put((item, None))
+        except BaseException as e:
+            put((_DONE, e))
+            raise
+        put((_DONE, None))
+
+    # Async API, usable from any event loop
+
+    async def _on_loop(self, coro):
+        """Await a coroutine on the gateway loop, whichever loop the caller is on"""
+        if asyncio.get_running_loop() is self._loop:
+            return await coro
+        return await asyncio.wrap_future(asyncio.run_coroutine_threadsafe(coro, self._loop))
+
+    async def agenerate(self, route, contents, config=None, coalesce=True, deadline=None, priority=None,
+                        return_model=False):
+        """Generate content for a route, e.g. tutor.explain_concept
+
+        Each attempt is limited by the route's timeout, and the whole call by
+        deadline (a time.monotonic() value, see deadline_in) when one is given;
+        DeadlineExceeded is raised when either runs out. coalesce=False always
+        issues a fresh call, for callers that need a response of their own
+        rather than one shared with identical requests. priority is a class
+        from scheduler.PRIORITY_CLASSES, the route's own by default; queued
+        background work can fail with Preempted. With return_model, a
+        (response, model) pair is returned, model being the one that answered
+        after any fallback, retry or hedge.
+        """
+        response, model = await self._on_loop(self._generate_on_loop(route, contents, config, coalesce, deadline, priority))
+        return (response, model) if return_model else response
+
+    async def astream(self, route, contents, config=None, deadline=None, priority=None):
+        """Generate content for a route, yielding response chunks"""
+        stream = self._stream_on_loop(route, contents, config, deadline, priority)
+        if asyncio.get_running_loop() is self._loop:
+            async for chunk in stream:
+                yield chunk
+            return
+
+        # Relay chunks produced on the gateway loop to the caller's loop
+        caller_loop = asyncio.get_running_loop()
+        relay = asyncio.Queue()
+        pump = asyncio.run_coroutine_threadsafe(
+            self._pump(stream, lambda entry: caller_loop.call_soon_threadsafe(relay.put_nowait, entry)),
+            self._loop
+        )
+        try:
+            while True:
+                item, error = await relay.get()
+                if item is _DONE:
+                    if error is not None:
+                        raise error
+                    return
+                yield item
+        finally:
+            pump.cancel()
+
+    # Blocking API, for threads without an event loop
+
+    def submit(self, coro):
+        """Start a coroutine on the gateway loop without waiting, returning a concurrent.futures.Future"""
+        return asyncio.run_coroutine_threadsafe(coro, self._loop)
+
+    @contextmanager
+    def interruptible(self, check, interval=0.25):
+        """Call check() every interval seconds while this thread waits on the gateway
+
+        If check raises, the generation being waited on is cancelled and the
+        exception propagates. Streamlit pages pass a check that touches the
+        page, which raises as soon as the user clicks Stop (or anything else).
+        """
+        previous = getattr(self._local, 'check', None)
+        self._local.check = (check, interval)
+        try:
+            yield
+        finally:
+            self._local.check = previous
+
+    def wait(self, future):
+        """Wait for a future from submit, cancelling it if the wait is interrupted"""
+        check = getattr(self._local, 'check', None)
+        try:
+            if check is not None:
+                callback, interval = check
+                while not concurrent.futures.wait([future], timeout=interval).done:
+                    callback()
+            return future.result()
+        except BaseException:
+            future.cancel()
+            raise
+
+    def run(self, coro):
+        """Run a coroutine on the gateway loop and wait for its result"""
+        return self.wait(self.submit(coro))
+
+    def iterate(self, agen):
+        """Consume an async generator on the gateway loop as a regular generator"""
+        relay = queue.Queue()
+        pump = asyncio.run_coroutine_threadsafe(self._pump(agen, relay.put), self._loop)
+        check = getattr(self._local, 'check', None)
+        try:
+            while True:
+                if check is None:
+                    item, error = relay.get()
+                else:
+                    callback, interval = check
+                    try:
+                        item, error = relay.get(timeout=interval)
+                    except queue.Empty:
+                        callback()
+                        continue
+                if item is _DONE:
+                    if error is not None:
+                        raise error
+                    return
+                yield item
+        finally:
+            # Abandoning the generator cancels the generation
+            pump.cancel()
+
+    def generate(self, route, contents, config=None, coalesce=True, deadline=None, priority=None):
+        """Blocking form of agenerate"""
+        return self.run(self.agenerate(route, contents, config, coalesce, deadline, priority))
+
+    def generate_stream(self, route, contents, config=None, deadline=None, priority=None):
+        """Blocking form of astream"""
+        return self.iterate(self.astream(route, contents, config, deadline, priority))
+
+    def close(self):
+        """Stop the gateway loop"""
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+
+_gateway = None
+_gateway_lock = threading.Lock()
+
+def get_gateway():
+    """Get the process-wide gateway, creating it on first use"""
+    global _gateway
+    with _gateway_lock:
+        if _gateway is None:
+            _gateway = LLMGateway.from_env()
+        return _gateway
@@ -0,0 +1,196 @@
+"""
+Versioned schema migrations for the Educational Tutor database
+
+The schema version lives in PRAGMA user_version. Each migration runs once,
+in order, inside the caller's transaction, and a database that is already
+current is left alone so startup issues no DDL at all.
+"""
+
+def schema_version(conn):
+    """Get the schema version recorded in the database file"""
+    return conn.execute('PRAGMA user_version').fetchone()[0]
+
+def add_column(cursor, table, column, definition):
+    """Add a column unless it already exists
+    
+    ALTER TABLE ... ADD COLUMN only rewrites the schema entry, never the
+    table's rows, so this is cheap even on large tables.
+    """
+    cursor.execute(f'PRAGMA table_info({table})')
+    if column not in [row[1] for row in cursor.fetchall()]:
+        cursor.execute(f'ALTER TABLE {table} ADD COLUMN {column} {definition}')
+
+def _create_base_tables(cursor):
+    """Create the original tables; databases made before versioning already have them"""
+    # Users table
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS users (
+            user_id TEXT PRIMARY KEY,
+            username TEXT UNIQUE NOT NULL,
+            email TEXT UNIQUE NOT NULL,
+            password_hash TEXT NOT NULL,
+            full_name TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            last_active TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+    # Progress table
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS progress (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id TEXT,
+            subject TEXT,
+            topic TEXT,
+            completed BOOLEAN DEFAULT FALSE,
+            best_score REAL DEFAULT 0,
+            chat_count INTEGER DEFAULT 0,
+            last_updated TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES users (user_id)
+        )
+    ''')
+
+    # Quiz attempts table
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS quiz_attempts (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id TEXT,
+            subject TEXT,
+            topic TEXT,
+            score REAL,
+            questions_data TEXT,
+            answers_data TEXT,
+            attempt_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES users (user_id)
+        )
+    ''')
+
+    # Chat sessions table
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS chat_sessions (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id TEXT,
+            subject TEXT,
+            topic TEXT,
+            message_count INTEGER DEFAULT 0,
+            session_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES users (user_id)
+        )
+    ''')
+
+def _merge_duplicate_progress(cursor):
+    """Collapse duplicate progress rows into the oldest one"""
+    # Older versions could race into duplicate rows. Updates were applied
+    # to every duplicate, so the maximum of each column is the true value.
+    cursor.execute('''
+        UPDATE progress
+        SET completed = (
+                SELECT MAX(p.completed) FROM progress p
+                WHERE p.user_id = progress.user_id AND p.subject = progress.subject AND p.topic = progress.topic
+            ),
+            best_score = (
+                SELECT MAX(p.best_score) FROM progress p
+                WHERE p.user_id = progress.user_id AND p.subject = progress.subject AND p.topic = progress.topic
+            ),
+            chat_count = (
+                SELECT MAX(p.chat_count) FROM progress p
+                WHERE p.user_id = progress.user_id AND p.subject = progress.subject AND p.topic = progress.topic
+            ),
+            last_updated = (
+                SELECT MAX(p.last_updated) FROM progress p
+                WHERE p.user_id = progress.user_id AND p.subject = progress.subject AND p.topic = progress.topic
+            )
+        WHERE id IN (
+            SELECT MIN(id) FROM progress
+            GROUP BY user_id, subject, topic
+            HAVING COUNT(*) > 1
+        )
+    ''')
+    cursor.execute('''
+        DELETE FROM progress
+        WHERE id NOT IN (
+            SELECT MIN(id) FROM progress
+            GROUP BY user_id, subject, topic
+        )
+    ''')
+
+def _add_lookup_indexes(cursor):
+    """Enforce one progress row per (user, subject, topic) and index the per-user lookups"""
+    cursor.execute('''
+        SELECT 1 FROM sqlite_master
+        WHERE type = 'index' AND name = 'idx_progress_user_subject_topic'
+    ''')
+    if not cursor.fetchone():
+        _merge_duplicate_progress(cursor)
+
+        cursor.execute('''
+            CREATE UNIQUE INDEX idx_progress_user_subject_topic
+            ON progress (user_id, subject, topic)
+        ''')
+    
+    # Composite indexes for the per-user lookups. The quiz_attempts
+    # indexes cover get_quiz_history so it never touches the table
+    # and never sorts.
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_quiz_attempts_user_subject_topic_date
+        ON quiz_attempts (user_id, subject, topic, attempt_date DESC, score)
+    ''')
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_quiz_attempts_user_subject_date
+        ON quiz_attempts (user_id, subject, attempt_date DESC, topic, score)
+    ''')
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_chat_sessions_user_subject_topic
+        ON chat_sessions (user_id, subject, topic)
+    ''')
+
+def _create_quiz_pool(cursor):
+    """Store ready-made quizzes waiting to be served"""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS quiz_pool (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            subject TEXT NOT NULL,
+            topic TEXT NOT NULL,
+            difficulty TEXT NOT NULL,
+            num_questions INTEGER NOT NULL,
+            quiz_data TEXT NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    # Quizzes are taken oldest first within each pool
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_quiz_pool_key
+        ON quiz_pool (subject, topic, difficulty, num_questions, id)
+    ''')
+
+def _add_quiz_recommendations(cursor):
+    """Keep the recommendations generated for an attempt alongside it"""
+    add_column(cursor, 'quiz_attempts', 'recommendations', 'TEXT')
+
+# Ordered (version, description, apply) entries. Append only: released
+# migrations must never be edited or reordered.
+MIGRATIONS = [
+    (1, "base tables", _create_base_tables),
+    (2, "unique progress key and lookup indexes", _add_lookup_indexes),
+    (3, "quiz pool", _create_quiz_pool),
+    (4, "quiz attempt recommendations", _add_quiz_recommendations),
+]
+
+SCHEMA_VERSION = MIGRATIONS[-1][0]
+
+def migrate(conn):
+    """Apply pending migrations; call inside a write transaction
+    
+    Returns the versions that were applied.
+    """
+    cursor = conn.cursor()
+    current = schema_version(conn)
+    applied = []
+    
+    for version, description, apply in MIGRATIONS:
+        if version > current:
+            apply(cursor)
+            cursor.execute(f'PRAGMA user_version = {version}')
+            applied.append(version)
+    
+    return applied
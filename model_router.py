@@ -0,0 +1,153 @@
+"""
+Per-method model routing with latency-aware fallback
+
+Every engine method has a route naming a primary model and a faster
+fallback. The router keeps an exponentially weighted moving average of the
+latency and error rate each route sees on each model. Once the primary's
+average latency exceeds the route's SLO, or too many of its calls fail, new
+requests go to the fallback. Every probe_interval seconds one request is
+still sent to the primary, so traffic returns to it once it recovers.
+"""
+import os
+import threading
+import time
+
+# route -> primary model, fallback model, latency SLO in milliseconds, the
+# timeout of a single attempt in seconds, whether slow requests are hedged
+# (see hedging.py; it suits interactive routes with short replies) and the
+# priority class its requests are scheduled in (see scheduler.py)
+ROUTES = {
+    "tutor.generate_response": {"primary": "gemini-2.5-flash", "fallback": "gemini-2.5-flash-lite", "slo_ms": 8000, "timeout_seconds": 30, "hedge": True, "priority": "chat"},
+    "tutor.get_learning_tips": {"primary": "gemini-2.5-flash", "fallback": "gemini-2.5-flash-lite", "slo_ms": 15000, "timeout_seconds": 60, "hedge": True, "priority": "chat"},
+    "tutor.generate_practice_problem": {"primary": "gemini-2.5-flash", "fallback": "gemini-2.5-flash-lite", "slo_ms": 15000, "timeout_seconds": 60, "hedge": True, "priority": "chat"},
+    "tutor.explain_concept": {"primary": "gemini-2.5-flash", "fallback": "gemini-2.5-flash-lite", "slo_ms": 15000, "timeout_seconds": 60, "hedge": True, "priority": "chat"},
+    "tutor.get_study_recommendations": {"primary": "gemini-2.5-flash", "fallback": "gemini-2.5-flash-lite", "slo_ms": 15000, "timeout_seconds": 60, "hedge": True, "priority": "chat"},
+    # Quizzes need the stronger model; short free-text feedback does not
+    "quiz.generate_quiz": {"primary": "gemini-2.5-pro", "fallback": "gemini-2.5-flash", "slo_ms": 45000, "timeout_seconds": 120, "hedge": False, "priority": "quiz"},
+    "quiz.get_recommendations": {"primary": "gemini-2.5-flash", "fallback": "gemini-2.5-flash-lite", "slo_ms": 10000, "timeout_seconds": 45, "hedge": True, "priority": "quiz"},
+}
+
+class ModelRouter:
+    def __init__(self, routes=None, smoothing=0.2, max_error_rate=0.3, min_samples=3, probe_interval=30.0):
+        self.routes = {name: dict(route) for name, route in ROUTES.items()}
+        for name, route in (routes or {}).items():
+            self.routes.setdefault(name, {}).update(route)
+
+        self.smoothing = smoothing
+        self.max_error_rate = max_error_rate
+        self.min_samples = min_samples
+        self.probe_interval = probe_interval
+
+        # (route, model) -> {'latency_ms', 'error_rate', 'samples'}
+        self._health = {}
+        # route -> when the degraded primary was last probed
+        self._last_probe = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls):
+        """Build a router with overrides from LLM_ROUTE_* environment variables
+
+        LLM_ROUTE_QUIZ_GENERATE_QUIZ="gemini-2.5-pro,gemini-2.5-flash" sets a
+        route's primary and fallback, LLM_ROUTE_QUIZ_GENERATE_QUIZ_SLO_MS its SLO
+        LLM_ROUTE_QUIZ_GENERATE_QUIZ_TIMEOUT_SECONDS its per-attempt timeout and
+        LLM_ROUTE_QUIZ_GENERATE_QUIZ_HEDGE=1 or 0 whether it is hedged.
+        """
+        routes = {}
+        for name in ROUTES:
+            prefix = "LLM_ROUTE_" + name.replace(".", "_").upper()
+            override = {}
+
+            models = os.getenv(prefix)
+            if models:
+                primary, _, fallback = models.partition(",")
+                override["primary"] = primary.strip()
+                override["fallback"] = fallback.strip() or primary.strip()
+
+            slo_ms = os.getenv(f"{prefix}_SLO_MS")
+            if slo_ms:
+                override["slo_ms"] = float(slo_ms)
+
+            timeout_seconds = os.getenv(f"{prefix}_TIMEOUT_SECONDS")
+            if timeout_seconds:
+                override["timeout_seconds"] = float(timeout_seconds)
+
+            hedge = os.getenv(f"{prefix}_HEDGE")
+            if hedge:
+                override["hedge"] = hedge != "0"
+
+            if override:
+                routes[name] = override
+
+        return cls(
+            routes=routes,
+            probe_interval=float(os.getenv("LLM_ROUTE_PROBE_SECONDS", "30"))
+        )
+
+    def primary(self, route):
+        return self.routes[route]["primary"]
+
+    def fallback(self, route):
+        return self.routes[route]["fallback"]
+
+    def timeout(self, route):
+        return self.routes[route]["timeout_seconds"]
+
+    def hedged(self, route):
+        return self.routes[route].get("hedge", False)
+
+    def priority(self, route):
+        return self.routes[route].get("priority", "chat")
+
+    def _degraded(self, route, model):
+        """Whether a route's model is over its latency SLO or failing too often; call with the lock held"""
+        health = self._health.get((route, model))
+        if health is None or health['samples'] < self.min_samples:
+            return False
+        slow = health['latency_ms'] is not None and health['latency_ms'] > self.routes[route]["slo_ms"]
+        return slow or health['error_rate'] > self.max_error_rate
+
+    def choose(self, route):
+        """Pick the model for the next request on a route"""
+        primary = self.primary(route)
+        with self._lock:
+            if not self._degraded(route, primary):
+                return primary
+
+            # Let one request through now and then to see if the primary recovered
+            now = time.monotonic()
+            if now - self._last_probe.get(route, 0) >= self.probe_interval:
+                self._last_probe[route] = now
+                return primary
+
+        return self.fallback(route)
+
+    def record(self, route, model, latency_ms, ok):
+        """Fold a finished request into the route's moving averages for that model"""
+        error = 0.0 if ok else 1.0
+        with self._lock:
+            health = self._health.get((route, model))
+            if ok and latency_ms <= self.routes[route]["slo_ms"] and self._degraded(route, model):
+                # A healthy probe: trust the model again from scratch
+                health = None
+
+            if health is None:
+                health = self._health[(route, model)] = {'latency_ms': None, 'error_rate': error, 'samples': 0}
+            else:
+                health['error_rate'] += self.smoothing * (error - health['error_rate'])
+
+            # Failed requests say nothing useful about latency
+            if ok:
+                if health['latency_ms'] is None:
+                    health['latency_ms'] = latency_ms
+                else:
+                    health['latency_ms'] += self.smoothing * (latency_ms - health['latency_ms'])
+            health['samples'] += 1
+
+    def snapshot(self):
+        """Get the current health of every route and model that has seen traffic"""
+        with self._lock:
+            return {
+                f"{route} -> {model}": dict(health, degraded=self._degraded(route, model))
+                for (route, model), health in self._health.items()
+            }
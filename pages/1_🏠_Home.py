@@ -4,6 +4,7 @@ from datetime import datetime
 from database import DatabaseManager
 from auth import AuthManager
 from subjects import SUBJECTS, get_all_subjects
+from quiz_engine import release_abandoned_prefetch
 
 # Configure page
 st.set_page_config(
@@ -28,6 +29,8 @@ def init_session_state():
 
 def main():
     db, auth = init_components()
+    # A quiz prefetched on the Quiz page is not needed once the student leaves it
+    release_abandoned_prefetch(st.session_state)
     init_session_state()
     
     # Enhanced CSS for beautiful modern design
@@ -338,8 +341,10 @@ def main():
         avg_score = 0
         total_chats = 0
         
+        all_progress = progress.get_all_progress(st.session_state.user_id)
+        
         for subject in SUBJECTS.keys():
-            user_progress = progress.get_user_progress(st.session_state.user_id, subject)
+            user_progress = all_progress.get(subject, {})
             if user_progress:
                 completed_topics = len([t for t in user_progress if user_progress[t]['completed']])
                 total_completed += completed_topics
@@ -411,4 +416,6 @@ def main():
         st.info("Start learning to see your recent activity here!")
 
 if __name__ == "__main__":
-    main()
+    # Per-rerun query counts when DB_INSTRUMENT=1
+    with init_components()[0].profile(f"Home rerun ({st.session_state.get('user_id', 'anonymous')})"):
+        main()
\ No newline at end of file
@@ -1,6 +1,8 @@
 import streamlit as st
+from contextlib import contextmanager
 from database import DatabaseManager
 from tutor_engine import TutorEngine
+from quiz_engine import release_abandoned_prefetch
 from progress_tracker import ProgressTracker
 from auth import AuthManager, require_auth
 from subjects import SUBJECTS, get_subject_topics
@@ -29,9 +31,27 @@ def init_session_state():
         st.session_state.current_topic = None
     if 'chat_history' not in st.session_state:
         st.session_state.chat_history = []
+    if 'partial_reply' not in st.session_state:
+        st.session_state.partial_reply = None
+
+@contextmanager
+def stoppable(tutor, message):
+    """Show a Stop button while generating; clicking it abandons the generation
+    
+    Any click reruns the script, and the status line is redrawn while the tutor
+    waits so Streamlit can interrupt the wait at once instead of after the reply.
+    """
+    status = st.empty()
+    status.caption(message)
+    st.button("⏹ Stop", key="stop_generation")
+    with tutor.gateway.interruptible(lambda: status.caption(message)):
+        yield
+    status.empty()
 
 def main():
     db, tutor, progress, auth = init_components()
+    # A quiz prefetched on the Quiz page is not needed once the student leaves it
+    release_abandoned_prefetch(st.session_state)
     
     # Check authentication
     if not require_auth(auth):
@@ -302,6 +322,13 @@ def main():
         st.markdown(f"## 💬 Learning: {st.session_state.current_topic}")
         st.markdown(f"*Subject: {st.session_state.current_subject}*")
         
+        # A streamed reply cut short by Stop keeps what had arrived
+        partial = st.session_state.partial_reply
+        if partial is not None:
+            if partial['key'] == (st.session_state.current_subject, st.session_state.current_topic):
+                st.session_state.chat_history.append({"role": "assistant", "content": partial['text'] + " *(stopped)*"})
+            st.session_state.partial_reply = None
+        
         # Display chat history
         for message in st.session_state.chat_history:
             if message['role'] == 'user':
@@ -313,17 +340,27 @@ def main():
         if prompt := st.chat_input("Ask a question about the topic..."):
             # Add user message
             st.session_state.chat_history.append({"role": "user", "content": prompt})
+            st.markdown(f'<div class="chat-message-user"><strong>You:</strong> {prompt}</div>', unsafe_allow_html=True)
             
-            # Generate response
-            with st.spinner("🤔 Thinking..."):
-                response = tutor.generate_response(
+            # Stream the response so the first words appear as soon as they arrive
+            reply_placeholder = st.empty()
+            reply_placeholder.markdown('<div class="chat-message-assistant"><strong>Tutor:</strong> 🤔 Thinking...</div>', unsafe_allow_html=True)
+            response = ""
+            reply_key = (st.session_state.current_subject, st.session_state.current_topic)
+            st.session_state.partial_reply = {'key': reply_key, 'text': response}
+            with stoppable(tutor, "Generating reply..."):
+                for chunk in tutor.generate_response_stream(
                     subject=st.session_state.current_subject,
                     topic=st.session_state.current_topic,
                     question=prompt,
                     chat_history=st.session_state.chat_history[:-1]
-                )
+                ):
+                    response += chunk
+                    st.session_state.partial_reply = {'key': reply_key, 'text': response}
+                    reply_placeholder.markdown(f'<div class="chat-message-assistant"><strong>Tutor:</strong> {response}</div>', unsafe_allow_html=True)
             
-            # Add assistant response
+            # Add assistant response once complete
+            st.session_state.partial_reply = None
             st.session_state.chat_history.append({"role": "assistant", "content": response})
             
             # Update progress
@@ -341,24 +378,29 @@ def main():
         
         with col1:
             if st.button("🎯 Get Learning Tips"):
-                tips = tutor.get_learning_tips(st.session_state.current_subject, st.session_state.current_topic)
+                with stoppable(tutor, "Preparing learning tips..."):
+                    tips = tutor.get_learning_tips(st.session_state.current_subject, st.session_state.current_topic)
                 st.session_state.chat_history.append({"role": "assistant", "content": tips})
                 progress.update_chat_progress(st.session_state.user_id, st.session_state.current_subject, st.session_state.current_topic)
                 st.rerun()
         
         with col2:
             if st.button("📝 Practice Problem"):
-                problem = tutor.generate_practice_problem(st.session_state.current_subject, st.session_state.current_topic)
+                with stoppable(tutor, "Writing a practice problem..."):
+                    problem = tutor.generate_practice_problem(st.session_state.current_subject, st.session_state.current_topic)
                 st.session_state.chat_history.append({"role": "assistant", "content": problem})
                 progress.update_chat_progress(st.session_state.user_id, st.session_state.current_subject, st.session_state.current_topic)
                 st.rerun()
         
         with col3:
             if st.button("🔍 Explain Concept"):
-                explanation = tutor.explain_concept(st.session_state.current_subject, st.session_state.current_topic)
+                with stoppable(tutor, "Explaining the concept..."):
+                    explanation = tutor.explain_concept(st.session_state.current_subject, st.session_state.current_topic)
                 st.session_state.chat_history.append({"role": "assistant", "content": explanation})
                 progress.update_chat_progress(st.session_state.user_id, st.session_state.current_subject, st.session_state.current_topic)
                 st.rerun()
 
 if __name__ == "__main__":
-    main()
+    # Per-rerun query counts when DB_INSTRUMENT=1
+    with init_components()[0].profile(f"Learn rerun ({st.session_state.get('user_id', 'anonymous')})"):
+        main()
\ No newline at end of file
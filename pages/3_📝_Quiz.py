@@ -1,4 +1,5 @@
 import streamlit as st
+from contextlib import contextmanager
 from database import DatabaseManager
 from quiz_engine import QuizEngine
 from progress_tracker import ProgressTracker
@@ -16,7 +17,7 @@ st.set_page_config(
 @st.cache_resource
 def init_components():
     db = DatabaseManager()
-    quiz = QuizEngine()
+    quiz = QuizEngine(db=db)
     progress = ProgressTracker(db)
     auth = AuthManager(db)
     return db, quiz, progress, auth
@@ -33,6 +34,50 @@ def init_session_state():
         st.session_state.quiz_answers = {}
     if 'quiz_score' not in st.session_state:
         st.session_state.quiz_score = None
+    if 'quiz_prefetch' not in st.session_state:
+        st.session_state.quiz_prefetch = None
+    if 'quiz_attempt_id' not in st.session_state:
+        st.session_state.quiz_attempt_id = None
+    if 'quiz_stopped_key' not in st.session_state:
+        st.session_state.quiz_stopped_key = None
+
+def start_quiz_prefetch(quiz):
+    """Start generating the selected topic's quiz while the student reads the start screen"""
+    key = (st.session_state.current_subject, st.session_state.current_topic)
+    prefetch = st.session_state.quiz_prefetch
+    if prefetch and prefetch['key'] == key:
+        return
+    
+    discard_quiz_prefetch(quiz)
+    if st.session_state.quiz_stopped_key == key:
+        # The student stopped this quiz; wait for them to start it again
+        return
+    st.session_state.quiz_prefetch = {'key': key, 'future': quiz.prefetch_quiz(*key)}
+
+def discard_quiz_prefetch(quiz):
+    """Cancel the speculative quiz, or return it to the shared pool if it is already done"""
+    prefetch = st.session_state.quiz_prefetch
+    if prefetch:
+        quiz.release_prefetched_quiz(prefetch['future'], *prefetch['key'])
+        st.session_state.quiz_prefetch = None
+
+def stop_quiz_generation():
+    """Remember that the student stopped the quiz being generated"""
+    st.session_state.quiz_stopped_key = (st.session_state.current_subject, st.session_state.current_topic)
+
+@contextmanager
+def stoppable(quiz, message):
+    """Show a Stop button while generating; clicking it abandons the generation
+    
+    Any click reruns the script, and the status line is redrawn while the quiz
+    engine waits so Streamlit can interrupt the wait at once.
+    """
+    status = st.empty()
+    status.caption(message)
+    st.button("⏹ Stop", key="stop_generation", on_click=stop_quiz_generation)
+    with quiz.gateway.interruptible(lambda: status.caption(message)):
+        yield
+    status.empty()
 
 def main():
     db, quiz, progress, auth = init_components()
@@ -329,6 +374,12 @@ def main():
             st.progress(progress_value)
             st.caption(f"{len(st.session_state.quiz_answers)}/{len(st.session_state.current_quiz['questions'])} questions answered")
     
+    # Speculatively generate the quiz as soon as a topic is picked
+    if st.session_state.current_topic and st.session_state.current_quiz is None:
+        start_quiz_prefetch(quiz)
+    else:
+        discard_quiz_prefetch(quiz)
+    
     # Main content
     if not st.session_state.current_subject:
         # Subject selection
@@ -380,20 +431,38 @@ def main():
             col1, col2, col3 = st.columns([1, 2, 1])
             with col2:
                 if st.button("🚀 Start Quiz", type="primary", use_container_width=True):
-                    with st.spinner("🧠 Generating your personalized quiz..."):
-                        st.session_state.current_quiz = quiz.generate_quiz(
+                    st.session_state.quiz_stopped_key = None
+                    start_quiz_prefetch(quiz)
+                    with stoppable(quiz, "🧠 Generating your personalized quiz..."):
+                        # Usually already generated in the background
+                        prefetch = st.session_state.quiz_prefetch
+                        st.session_state.quiz_prefetch = None
+                        st.session_state.current_quiz = quiz.claim_prefetched_quiz(
+                            prefetch['future'],
                             st.session_state.current_subject,
                             st.session_state.current_topic
                         )
                         st.session_state.quiz_answers = {}
                         st.session_state.quiz_score = None
                     st.rerun()
+            
+            # Recommendations saved with the last attempt, no model call needed
+            last_attempt = db.get_latest_quiz_attempt(
+                st.session_state.user_id,
+                st.session_state.current_subject,
+                st.session_state.current_topic
+            )
+            if last_attempt and last_attempt['recommendations']:
+                with st.expander(f"💡 Recommendations from your last attempt ({last_attempt['score']:.0f}%)"):
+                    st.info(last_attempt['recommendations'])
         
         else:
             # Display quiz
             quiz_data = st.session_state.current_quiz
             
             st.markdown(f'<div class="quiz-container"><h3>📋 {quiz_data["title"]}</h3></div>', unsafe_allow_html=True)
+            if quiz_data.get('is_fallback'):
+                st.warning("Quiz generation is unavailable right now, so this is a short basic quiz. Reset the quiz to try again in a minute.")
             
             # Display questions
             for i, question in enumerate(quiz_data['questions']):
@@ -419,13 +488,14 @@ def main():
                     score = quiz.calculate_score(quiz_data, st.session_state.quiz_answers)
                     st.session_state.quiz_score = score
                     
-                    # Update progress
-                    progress.update_quiz_progress(
-                        st.session_state.user_id,
-                        st.session_state.current_subject,
-                        st.session_state.current_topic,
-                        score
-                    )
+                    # Everything recorded for this submission commits together
+                    with db.transaction():
+                        st.session_state.quiz_attempt_id = progress.update_quiz_progress(
+                            st.session_state.user_id,
+                            st.session_state.current_subject,
+                            st.session_state.current_topic,
+                            score
+                        )
                     st.rerun()
             
             with col2:
@@ -461,8 +531,10 @@ def main():
                 else:
                     st.warning("📚 Keep studying! Review the material and try again.")
                 
-                # Get recommendations
-                recommendations = quiz.get_recommendations(
+                # Generated once per attempt and stored with it, so reruns
+                # read them back instead of asking the model again
+                recommendations = quiz.get_attempt_recommendations(
+                    st.session_state.quiz_attempt_id,
                     st.session_state.current_subject,
                     st.session_state.current_topic,
                     score
@@ -473,4 +545,6 @@ def main():
                     st.info(recommendations)
 
 if __name__ == "__main__":
-    main()
+    # Per-rerun query counts when DB_INSTRUMENT=1
+    with init_components()[0].profile(f"Quiz rerun ({st.session_state.get('user_id', 'anonymous')})"):
+        main()
\ No newline at end of file
@@ -5,6 +5,7 @@ import pandas as pd
 from datetime import datetime
 from database import DatabaseManager
 from progress_tracker import ProgressTracker
+from quiz_engine import release_abandoned_prefetch
 from auth import AuthManager, require_auth
 from subjects import SUBJECTS, get_subject_topics
 
@@ -25,6 +26,8 @@ def init_components():
 
 def main():
     db, progress, auth = init_components()
+    # A quiz prefetched on the Quiz page is not needed once the student leaves it
+    release_abandoned_prefetch(st.session_state)
     
     # Check authentication
     if not require_auth(auth):
@@ -413,7 +416,7 @@ def main():
         # Achievements section
         st.markdown("## 🏆 Achievements")
         
-        badges = progress.get_achievement_badges(st.session_state.user_id, selected_subject)
+        badges = progress.get_achievement_badges(st.session_state.user_id, selected_subject, user_progress)
         
         if badges:
             cols = st.columns(min(len(badges), 4))
@@ -474,4 +477,6 @@ def main():
                 )
 
 if __name__ == "__main__":
-    main()
+    # Per-rerun query counts when DB_INSTRUMENT=1
+    with init_components()[0].profile(f"Progress rerun ({st.session_state.get('user_id', 'anonymous')})"):
+        main()
\ No newline at end of file
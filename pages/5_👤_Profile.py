@@ -2,6 +2,7 @@ import streamlit as st
 from datetime import datetime
 from database import DatabaseManager
 from progress_tracker import ProgressTracker
+from quiz_engine import release_abandoned_prefetch
 from auth import AuthManager, require_auth
 from subjects import SUBJECTS
 
@@ -22,6 +23,8 @@ def init_components():
 
 def main():
     db, progress, auth = init_components()
+    # A quiz prefetched on the Quiz page is not needed once the student leaves it
+    release_abandoned_prefetch(st.session_state)
     
     # Check authentication
     if not require_auth(auth):
@@ -278,6 +281,9 @@ def main():
     # Tabs for different sections
     tab1, tab2, tab3, tab4 = st.tabs(["📊 Overview", "🏆 Achievements", "⚙️ Settings", "📱 Account"])
     
+    # One query serves every subject on the overview and achievements tabs
+    all_progress = progress.get_all_progress(st.session_state.user_id)
+    
     with tab1:
         st.markdown("## 📊 Learning Overview")
         
@@ -289,7 +295,7 @@ def main():
         highest_score = 0
         
         for subject in SUBJECTS.keys():
-            user_progress = progress.get_user_progress(st.session_state.user_id, subject)
+            user_progress = all_progress.get(subject, {})
             if user_progress:
                 total_subjects_started += 1
                 completed_topics = len([t for t in user_progress if user_progress[t]['completed']])
@@ -352,7 +358,7 @@ def main():
         st.markdown("### 📚 Subject Progress")
         
         for subject, info in SUBJECTS.items():
-            user_progress = progress.get_user_progress(st.session_state.user_id, subject)
+            user_progress = all_progress.get(subject, {})
             
             if user_progress:
                 topics = len(user_progress)
@@ -381,7 +387,9 @@ def main():
         
         all_badges = []
         for subject in SUBJECTS.keys():
-            subject_badges = progress.get_achievement_badges(st.session_state.user_id, subject)
+            subject_badges = progress.get_achievement_badges(
+                st.session_state.user_id, subject, all_progress.get(subject, {})
+            )
             for badge in subject_badges:
                 badge['subject'] = subject
             all_badges.extend(subject_badges)
@@ -513,4 +521,6 @@ def main():
         st.markdown('</div>', unsafe_allow_html=True)
 
 if __name__ == "__main__":
-    main()
+    # Per-rerun query counts when DB_INSTRUMENT=1
+    with init_components()[0].profile(f"Profile rerun ({st.session_state.get('user_id', 'anonymous')})"):
+        main()
\ No newline at end of file
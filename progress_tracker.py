@@ -9,41 +9,26 @@ class ProgressTracker:
         """Get comprehensive user progress for a subject"""
         return self.db.get_user_progress(user_id, subject)
     
+    def get_all_progress(self, user_id):
+        """Get progress for every subject at once, keyed by subject then topic"""
+        return self.db.get_all_progress(user_id)
+    
     def get_topic_progress(self, user_id, subject, topic):
         """Get progress for a specific topic"""
         return self.db.get_topic_progress(user_id, subject, topic)
     
     def update_chat_progress(self, user_id, subject, topic):
         """Update progress based on chat activity"""
-        current_progress = self.db.get_topic_progress(user_id, subject, topic)
-        new_chat_count = current_progress['chat_count'] + 1
-        
-        self.db.update_progress(
-            user_id, subject, topic,
-            chat_count=new_chat_count
-        )
-        
-        # Save chat session record
-        self.db.save_chat_session(user_id, subject, topic, 1)
+        # Counter increment and session record happen atomically in the database
+        self.db.record_chat_activity(user_id, subject, topic, 1)
     
     def update_quiz_progress(self, user_id, subject, topic, score):
         """Update progress based on quiz performance"""
-        current_progress = self.db.get_topic_progress(user_id, subject, topic)
-        
-        # Update best score if this is better
-        new_best_score = max(current_progress['best_score'], score)
+        # Mark as completed if score is >= 80%; the database keeps the best
+        # score and completion state monotonic
+        completed = score >= 80
         
-        # Mark as completed if score is >= 80%
-        completed = score >= 80 or current_progress['completed']
-        
-        self.db.update_progress(
-            user_id, subject, topic,
-            best_score=new_best_score,
-            completed=completed
-        )
-        
-        # Save quiz attempt
-        self.db.save_quiz_attempt(user_id, subject, topic, score, {}, {})
+        return self.db.record_quiz_attempt(user_id, subject, topic, score, completed, {}, {})
     
     def get_learning_recommendations(self, user_id, subject):
         """Generate learning recommendations based on progress"""
@@ -124,9 +109,14 @@ class ProgressTracker:
             # Fallback to a reasonable default
             return 1
     
-    def get_achievement_badges(self, user_id, subject):
-        """Calculate achievement badges based on progress"""
-        user_progress = self.get_user_progress(user_id, subject)
+    def get_achievement_badges(self, user_id, subject, user_progress=None):
+        """Calculate achievement badges based on progress
+        
+        Pass the subject's entry from get_all_progress as user_progress to
+        avoid querying the database again.
+        """
+        if user_progress is None:
+            user_progress = self.get_user_progress(user_id, subject)
         badges = []
         
         if not user_progress:
@@ -0,0 +1,187 @@
+"""
+Opt-in query instrumentation for the DatabaseManager
+
+When enabled, every pooled connection is opened with InstrumentedConnection,
+which times each statement (including fetching its rows) and counts the rows
+returned. QueryStats keeps per-statement totals plus per-scope totals, where a
+scope is typically one Streamlit rerun. Statements slower than the threshold
+are written to the slow-query log together with their EXPLAIN QUERY PLAN.
+"""
+import logging
+import sqlite3
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+query_logger = logging.getLogger("database.queries")
+slow_query_logger = logging.getLogger("database.slow_queries")
+
+# Statements EXPLAIN QUERY PLAN can describe; DDL and PRAGMAs are logged without a plan
+PLANNABLE_STATEMENTS = ('SELECT', 'INSERT', 'UPDATE', 'DELETE', 'REPLACE', 'WITH')
+
+class QueryStats:
+    """Collects statement timings and row counts across all connections"""
+
+    def __init__(self, slow_query_ms=50.0, slow_query_log=None, keep_scopes=100):
+        self.slow_query_ms = slow_query_ms
+        self._lock = threading.Lock()
+        self._statements = {}
+        self._local = threading.local()
+        # Summaries of the most recently finished scopes
+        self.recent_scopes = deque(maxlen=keep_scopes)
+
+        if slow_query_log:
+            handler = logging.FileHandler(slow_query_log)
+            handler.setFormatter(logging.Formatter('%(asctime)s %(message)s'))
+            slow_query_logger.addHandler(handler)
+            slow_query_logger.setLevel(logging.WARNING)
+
+    def record(self, sql, elapsed_ms, rows, executed):
+        """Add timing and rows to a statement; executed marks a new execution"""
+        with self._lock:
+            entry = self._statements.get(sql)
+            if entry is None:
+                entry = self._statements[sql] = {
+                    'sql': sql,
+                    'count': 0,
+                    'total_ms': 0.0,
+                    'max_ms': 0.0,
+                    'rows': 0
+                }
+            if executed:
+                entry['count'] += 1
+            entry['total_ms'] += elapsed_ms
+            entry['rows'] += rows
+
+        for scope in getattr(self._local, 'scopes', ()):
+            if executed:
+                scope['queries'] += 1
+            scope['total_ms'] += elapsed_ms
+            scope['rows'] += rows
+
+    def record_execution_time(self, sql, total_ms):
+        """Track the slowest complete execution of a statement"""
+        with self._lock:
+            entry = self._statements.get(sql)
+            if entry is not None and total_ms > entry['max_ms']:
+                entry['max_ms'] = total_ms
+
+    @contextmanager
+    def scope(self, label):
+        """Count the queries issued on this thread inside the block, e.g. one page rerun"""
+        scopes = getattr(self._local, 'scopes', None)
+        if scopes is None:
+            scopes = self._local.scopes = []
+
+        scope = {'label': label, 'queries': 0, 'total_ms': 0.0, 'rows': 0}
+        scopes.append(scope)
+        try:
+            yield scope
+        finally:
+            scopes.remove(scope)
+            self.recent_scopes.append(scope)
+            query_logger.info(
+                "%s: %d queries, %.1f ms, %d rows",
+                label, scope['queries'], scope['total_ms'], scope['rows']
+            )
+
+    def snapshot(self):
+        """Get per-statement stats, most expensive first"""
+        with self._lock:
+            statements = [dict(entry) for entry in self._statements.values()]
+        return sorted(statements, key=lambda entry: entry['total_ms'], reverse=True)
+
+    def reset(self):
+        """Forget everything recorded so far"""
+        with self._lock:
+            self._statements.clear()
+        self.recent_scopes.clear()
+
+    def log_slow_query(self, conn, sql, parameters, total_ms):
+        """Write a slow statement and its query plan to the slow-query log"""
+        if sql.split(' ', 1)[0].upper() not in PLANNABLE_STATEMENTS:
+            slow_query_logger.warning("%.1f ms: %s", total_ms, sql)
+            return
+
+        try:
+            plan_cursor = conn.cursor(sqlite3.Cursor)
+            plan_cursor.execute(f'EXPLAIN QUERY PLAN {sql}', parameters)
+            plan = '; '.join(row[-1] for row in plan_cursor.fetchall())
+        except sqlite3.Error as e:
+            plan = f'unavailable ({e})'
+
+        slow_query_logger.warning("%.1f ms: %s | plan: %s", total_ms, sql, plan or 'n/a')
+
+class InstrumentedCursor(sqlite3.Cursor):
+    """Cursor that reports each statement's execution and fetch time to QueryStats"""
+
+    def _start(self, sql, parameters):
+        self._sql = ' '.join(sql.split())
+        self._parameters = parameters
+        self._total_ms = 0.0
+        self._slow_logged = False
+
+    def _record(self, started, rows, executed=False):
+        stats = self.connection.stats
+        if stats is None:
+            # Not attached yet, e.g. while the pool sets up a new connection
+            return
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        stats.record(self._sql, elapsed_ms, rows, executed)
+
+        self._total_ms += elapsed_ms
+        stats.record_execution_time(self._sql, self._total_ms)
+        if not self._slow_logged and self._total_ms >= stats.slow_query_ms:
+            self._slow_logged = True
+            stats.log_slow_query(self.connection, self._sql, self._parameters, self._total_ms)
+
+    def execute(self, sql, parameters=()):
+        self._start(sql, parameters)
+        started = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            self._record(started, 0, executed=True)
+
+    def executemany(self, sql, seq_of_parameters):
+        seq_of_parameters = list(seq_of_parameters)
+        # The plan does not depend on the values, so any row will do for EXPLAIN
+        self._start(sql, seq_of_parameters[0] if seq_of_parameters else ())
+        started = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        finally:
+            self._record(started, 0, executed=True)
+
+    def fetchone(self):
+        started = time.perf_counter()
+        row = super().fetchone()
+        self._record(started, 1 if row is not None else 0)
+        return row
+
+    def fetchmany(self, size=None):
+        started = time.perf_counter()
+        rows = super().fetchmany(self.arraysize if size is None else size)
+        self._record(started, len(rows))
+        return rows
+
+    def fetchall(self):
+        started = time.perf_counter()
+        rows = super().fetchall()
+        self._record(started, len(rows))
+        return rows
+
+class InstrumentedConnection(sqlite3.Connection):
+    """Connection whose cursors, including those behind execute(), are instrumented"""
+
+    stats = None
+
+    def cursor(self, factory=InstrumentedCursor):
+        return super().cursor(factory)
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
@@ -1,24 +1,86 @@
-import os
+import asyncio
 import json
-from google import genai
+import os
+import threading
+import time
 from google.genai import types
-import random
+from llm_gateway import get_gateway
+from quiz_pool import QuizPool
+from rate_limiter import RateLimited
+from scheduler import Preempted
+
+# Prefetches not yet claimed or released, process-wide so any page can
+# release one: future -> (expires_at, engine, subject, topic, num_questions, difficulty)
+_prefetches = {}
+_prefetches_lock = threading.Lock()
+_expiry_thread = None
+
+def _expire_prefetches():
+    """Release prefetches nobody claimed in time"""
+    while True:
+        time.sleep(min(QuizEngine.PREFETCH_TTL_SECONDS, 30))
+        now = time.monotonic()
+        with _prefetches_lock:
+            expired = [(future, entry) for future, entry in _prefetches.items() if entry[0] <= now]
+            for future, _ in expired:
+                del _prefetches[future]
+        
+        for future, (_, engine, *quiz_key) in expired:
+            try:
+                engine._release(future, *quiz_key)
+            except Exception as e:
+                print(f"Error releasing expired quiz prefetch: {e}")
+
+def _forget_prefetch(future):
+    """Stop tracking a prefetch, returning its entry, or None if it was already claimed, released or expired"""
+    with _prefetches_lock:
+        return _prefetches.pop(future, None)
+
+def release_abandoned_prefetch(session_state):
+    """Release the Quiz page's prefetch once the student has moved on to another page"""
+    prefetch = session_state.get('quiz_prefetch')
+    if prefetch:
+        entry = _forget_prefetch(prefetch['future'])
+        if entry is not None:
+            _, engine, *quiz_key = entry
+            engine._release(prefetch['future'], *quiz_key)
+        session_state['quiz_prefetch'] = None
 
 class QuizEngine:
-    def __init__(self):
-        # Using Google Gemini AI for quiz generation
-        self.client = genai.Client(api_key=os.getenv("GEMINI_API_KEY"))
-        self.model = "gemini-2.5-pro"
+    # Difficulty levels a quiz can be generated at; "mixed" spans all three
+    DIFFICULTIES = ("mixed", "easy", "medium", "hard")
+    # Seconds an unclaimed prefetch is kept before it is released, for
+    # students who close the tab or wander off without starting the quiz
+    PREFETCH_TTL_SECONDS = float(os.getenv("QUIZ_PREFETCH_TTL_SECONDS", "600"))
     
-    def generate_quiz(self, subject, topic, num_questions=5):
-        """Generate a quiz for the specified topic"""
+    def __init__(self, gateway=None, db=None):
+        # Using Google Gemini AI for quiz generation, through the
+        # process-wide gateway so the HTTP client is shared
+        self.gateway = gateway or get_gateway()
+        # With a database, quizzes are served from a pre-generated pool and
+        # recommendations are stored with each attempt
+        self.db = db
+        self.quiz_pool = QuizPool.from_env(db, self._generate_live_quiz) if db is not None else None
+    
+    async def _agenerate_live_quiz(self, subject, topic, difficulty="mixed", num_questions=5, coalesce=True, deadline=None, priority=None):
+        """Generate a quiz with the model, returning None if it fails or is invalid
+        
+        Background priorities can raise Preempted, or RateLimited when no
+        quota is free right now, instead, so callers can tell work that was
+        never sent apart from a failed generation.
+        """
         try:
+            if difficulty == "mixed":
+                difficulty_requirement = "Mix difficulty levels (easy, medium, hard)"
+            else:
+                difficulty_requirement = f"Make every question {difficulty} difficulty"
+            
             prompt = f"""Create a {num_questions}-question multiple choice quiz about {topic} in {subject}.
             
             Requirements:
             - Each question should test understanding of key concepts
             - Provide 4 multiple choice options (A, B, C, D)
-            - Mix difficulty levels (easy, medium, hard)
+            - {difficulty_requirement}
             - Include clear, unambiguous questions
             - Make sure there's only one clearly correct answer per question
             
@@ -37,12 +99,15 @@ class QuizEngine:
             }}
             """
             
-            response = self.client.models.generate_content(
-                model=self.model,
-                contents=prompt,
+            response = await self.gateway.agenerate(
+                "quiz.generate_quiz",
+                prompt,
                 config=types.GenerateContentConfig(
                     response_mime_type="application/json"
-                )
+                ),
+                coalesce=coalesce,
+                deadline=deadline,
+                priority=priority
             )
             
             content = response.text or '{}'
@@ -50,13 +115,109 @@ class QuizEngine:
             
             # Validate and sanitize the quiz data
             if not self._validate_quiz_data(quiz_data):
-                return self._generate_fallback_quiz(subject, topic)
+                return None
             
             return quiz_data
             
+        except Preempted:
+            raise
+        except RateLimited as e:
+            # Background work never queues for quota; interactive callers
+            # waited as long as they may, so they get the fallback quiz
+            if priority is not None and self.gateway.scheduler.preemptible(priority):
+                raise
+            print(f"Error generating quiz: {e}")
+            return None
+        except Exception as e:
+            print(f"Error generating quiz: {e}")
+            return None
+    
+    def _generate_live_quiz(self, subject, topic, difficulty="mixed", num_questions=5):
+        """Blocking form of _agenerate_live_quiz, used by the pool's refill worker"""
+        # Never share a call with a student's live request, or the pool
+        # would hand out a quiz that student already has. Refills only use
+        # capacity students leave spare.
+        try:
+            return self.gateway.run(self._agenerate_live_quiz(subject, topic, difficulty, num_questions, coalesce=False, priority="warmup"))
+        except (Preempted, RateLimited):
+            return None
+    
+    async def _aget_quiz(self, subject, topic, difficulty, num_questions, deadline=None, priority=None):
+        """Take a quiz from the pool or generate one live, returning None if generation fails"""
+        if self.quiz_pool:
+            # Taking from the pool waits on SQLite's write lock; do that in a
+            # worker thread so it never holds up the gateway loop
+            quiz_data = await asyncio.to_thread(self.quiz_pool.take, subject, topic, difficulty, num_questions)
+            if quiz_data is not None:
+                return quiz_data
+        
+        return await self._agenerate_live_quiz(subject, topic, difficulty, num_questions, deadline=deadline, priority=priority)
+    
+    async def agenerate_quiz(self, subject, topic, num_questions=5, difficulty="mixed", deadline=None):
+        """Generate a quiz for the specified topic"""
+        quiz_data = await self._aget_quiz(subject, topic, difficulty, num_questions, deadline)
+        if quiz_data is None:
+            return self._generate_fallback_quiz(subject, topic)
+        return quiz_data
+    
+    def generate_quiz(self, subject, topic, num_questions=5, difficulty="mixed", deadline=None):
+        """Generate a quiz for the specified topic, blocking until it is ready"""
+        return self.gateway.run(self.agenerate_quiz(subject, topic, num_questions, difficulty, deadline))
+    
+    def prefetch_quiz(self, subject, topic, num_questions=5, difficulty="mixed"):
+        """Start getting a quiz in the background before the student asks for it
+        
+        Returns a future that resolves to the quiz, or to None if it could not
+        be generated. Hand it to claim_prefetched_quiz or release_prefetched_quiz;
+        one left with neither is released after PREFETCH_TTL_SECONDS. The
+        prefetch is speculative, so it runs at low priority.
+        """
+        global _expiry_thread
+        future = self.gateway.submit(self._aget_quiz(subject, topic, difficulty, num_questions, priority="prefetch"))
+        with _prefetches_lock:
+            _prefetches[future] = (time.monotonic() + self.PREFETCH_TTL_SECONDS, self, subject, topic, num_questions, difficulty)
+            if _expiry_thread is None:
+                _expiry_thread = threading.Thread(target=_expire_prefetches, name='quiz-prefetch-expiry', daemon=True)
+                _expiry_thread.start()
+        return future
+    
+    def claim_prefetched_quiz(self, future, subject, topic, num_questions=5, difficulty="mixed"):
+        """Wait for a prefetched quiz, using the fallback quiz if it failed"""
+        if _forget_prefetch(future) is None:
+            # Expired and handed back already; the pool may well have it
+            return self.generate_quiz(subject, topic, num_questions, difficulty)
+        
+        try:
+            quiz_data = self.gateway.wait(future)
+        except (Preempted, RateLimited):
+            # Dropped to make room for other students, or never sent for lack
+            # of spare quota; now that this student is waiting, it is
+            # interactive work too
+            return self.generate_quiz(subject, topic, num_questions, difficulty)
         except Exception as e:
             print(f"Error generating quiz: {e}")
+            quiz_data = None
+        
+        if quiz_data is None:
             return self._generate_fallback_quiz(subject, topic)
+        return quiz_data
+    
+    def release_prefetched_quiz(self, future, subject, topic, num_questions=5, difficulty="mixed"):
+        """Abandon a prefetched quiz: cancel it if still generating, otherwise return it to the pool"""
+        if _forget_prefetch(future) is not None:
+            self._release(future, subject, topic, num_questions, difficulty)
+    
+    def _release(self, future, subject, topic, num_questions, difficulty):
+        if future.cancel() or not self.quiz_pool:
+            return
+        
+        try:
+            quiz_data = future.result()
+        except Exception:
+            return
+        
+        if quiz_data is not None:
+            self.quiz_pool.put(subject, topic, difficulty, num_questions, quiz_data)
     
     def _validate_quiz_data(self, quiz_data):
         """Validate the structure of quiz data"""
@@ -89,6 +250,8 @@ class QuizEngine:
         """Generate a basic fallback quiz if AI generation fails"""
         return {
             "title": f"{topic} Quiz",
+            # Lets the page tell the student this is not a generated quiz
+            "is_fallback": True,
             "questions": [
                 {
                     "question": f"Which of the following is a key concept in {topic}?",
@@ -148,8 +311,8 @@ class QuizEngine:
         
         return results
     
-    def get_recommendations(self, subject, topic, score):
-        """Get personalized learning recommendations based on quiz performance"""
+    async def _agenerate_recommendations(self, subject, topic, score, deadline=None):
+        """Generate recommendations with the model, returning None if it fails"""
         try:
             if score >= 90:
                 performance = "excellent"
@@ -171,21 +334,57 @@ class QuizEngine:
             
             Keep the response concise but actionable."""
             
-            response = self.client.models.generate_content(
-                model=self.model,
-                contents=prompt
+            response = await self.gateway.agenerate(
+                "quiz.get_recommendations",
+                prompt,
+                deadline=deadline
             )
             
-            return response.text or "Unable to generate recommendations at the moment."
+            return response.text or None
             
         except Exception as e:
-            # Fallback recommendations based on score
-            if score >= 80:
-                return "🎉 Great job! You've demonstrated a solid understanding of this topic. Consider exploring more advanced concepts or helping others learn this material."
-            elif score >= 60:
-                return "👍 Good effort! Review the areas where you had difficulty and try some practice problems to strengthen your understanding."
-            else:
-                return "📚 Keep studying! Focus on the fundamental concepts and don't hesitate to ask questions. Consider reviewing the material again and taking practice quizzes."
+            print(f"Error generating recommendations: {e}")
+            return None
+    
+    def _fallback_recommendations(self, score):
+        """Fallback recommendations based on score"""
+        if score >= 80:
+            return "🎉 Great job! You've demonstrated a solid understanding of this topic. Consider exploring more advanced concepts or helping others learn this material."
+        elif score >= 60:
+            return "👍 Good effort! Review the areas where you had difficulty and try some practice problems to strengthen your understanding."
+        else:
+            return "📚 Keep studying! Focus on the fundamental concepts and don't hesitate to ask questions. Consider reviewing the material again and taking practice quizzes."
+    
+    async def aget_recommendations(self, subject, topic, score, deadline=None):
+        """Get personalized learning recommendations based on quiz performance"""
+        recommendations = await self._agenerate_recommendations(subject, topic, score, deadline)
+        return recommendations or self._fallback_recommendations(score)
+    
+    def get_recommendations(self, subject, topic, score, deadline=None):
+        """Get personalized learning recommendations, blocking until they are ready"""
+        return self.gateway.run(self.aget_recommendations(subject, topic, score, deadline))
+    
+    async def aget_attempt_recommendations(self, attempt_id, subject, topic, score, deadline=None):
+        """Get the recommendations for a saved quiz attempt, generating them only the first time"""
+        if self.db is None:
+            return await self.aget_recommendations(subject, topic, score, deadline)
+        
+        # SQLite calls block, so keep them off the gateway loop
+        recommendations = await asyncio.to_thread(self.db.get_quiz_recommendations, attempt_id)
+        if recommendations is not None:
+            return recommendations
+        
+        recommendations = await self._agenerate_recommendations(subject, topic, score, deadline)
+        if recommendations is None:
+            # Not stored, so the next view asks the model again
+            return self._fallback_recommendations(score)
+        
+        await asyncio.to_thread(self.db.save_quiz_recommendations, attempt_id, recommendations)
+        return recommendations
+    
+    def get_attempt_recommendations(self, attempt_id, subject, topic, score, deadline=None):
+        """Blocking form of aget_attempt_recommendations"""
+        return self.gateway.run(self.aget_attempt_recommendations(attempt_id, subject, topic, score, deadline))
     
     def analyze_performance_trends(self, quiz_history):
         """Analyze performance trends across multiple quiz attempts"""
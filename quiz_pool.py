@@ -0,0 +1,95 @@
+"""
+Pool of pre-generated quizzes
+
+Live quiz generation takes tens of seconds, so QuizEngine first tries to take
+a ready-made quiz from the quiz_pool table. Each (subject, topic, difficulty,
+question count) has its own pool; every quiz in it has already passed
+validation and is served to exactly one student. A background worker tops a
+pool back up to its target size whenever it drops below the low-water mark,
+so only the first students on a cold topic wait for live generation.
+"""
+import os
+import queue
+import threading
+from subjects import SUBJECT_TOPICS
+
+class QuizPool:
+    def __init__(self, db, generate, low_water=2, target=4, num_questions=5, warmup=False):
+        # generate(subject, topic, difficulty, num_questions) returns a
+        # validated quiz, or None when one could not be generated
+        self.db = db
+        self.generate = generate
+        self.low_water = low_water
+        self.target = max(target, low_water)
+        self.num_questions = num_questions
+
+        self._refills = queue.Queue()
+        self._queued = set()
+        self._lock = threading.Lock()
+        self._thread = threading.Thread(target=self._run, name='quiz-pool-refill', daemon=True)
+        self._thread.start()
+
+        if warmup:
+            self.warm_up()
+
+    @classmethod
+    def from_env(cls, db, generate):
+        """Build a pool from QUIZ_POOL_* environment variables, or None when QUIZ_POOL=0"""
+        if os.getenv("QUIZ_POOL", "1") == "0":
+            return None
+        return cls(
+            db,
+            generate,
+            low_water=int(os.getenv("QUIZ_POOL_LOW_WATER", "2")),
+            target=int(os.getenv("QUIZ_POOL_TARGET", "4")),
+            warmup=os.getenv("QUIZ_POOL_WARMUP") == "1"
+        )
+
+    def take(self, subject, topic, difficulty, num_questions):
+        """Take a ready-made quiz, or None when the pool is empty; either way the pool is topped up"""
+        quiz_data = self.db.take_pooled_quiz(subject, topic, difficulty, num_questions)
+        self.request_refill(subject, topic, difficulty, num_questions)
+        return quiz_data
+
+    def put(self, subject, topic, difficulty, num_questions, quiz_data):
+        """Add a validated quiz that was generated but never served"""
+        self.db.add_pooled_quiz(subject, topic, difficulty, num_questions, quiz_data)
+
+    def request_refill(self, subject, topic, difficulty="mixed", num_questions=None):
+        """Queue a pool for the refill worker unless it is already queued"""
+        key = (subject, topic, difficulty, num_questions or self.num_questions)
+        with self._lock:
+            if key in self._queued:
+                return
+            self._queued.add(key)
+        self._refills.put(key)
+
+    def warm_up(self):
+        """Queue the mixed-difficulty pool of every topic"""
+        for subject, topics in SUBJECT_TOPICS.items():
+            for topic in topics:
+                self.request_refill(subject, topic)
+
+    def _refill(self, key):
+        """Top a pool up to its target while it is below the low-water mark"""
+        if self.db.count_pooled_quizzes(*key) >= self.low_water:
+            return
+
+        while self.db.count_pooled_quizzes(*key) < self.target:
+            quiz_data = self.generate(*key)
+            if quiz_data is None:
+                # Leave the pool until the next take asks for it again rather
+                # than hammering an upstream that is failing
+                return
+            self.db.add_pooled_quiz(*key, quiz_data)
+
+    def _run(self):
+        while True:
+            key = self._refills.get()
+            try:
+                self._refill(key)
+            except Exception as e:
+                print(f"Error refilling quiz pool {key}: {e}")
+            finally:
+                with self._lock:
+                    self._queued.discard(key)
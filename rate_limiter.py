@@ -0,0 +1,207 @@
+"""
+Token-bucket rate limiting of model calls
+
+Gemini quotas are per model, in requests and tokens per minute. Each model
+gets two buckets, one per quota, refilled continuously at the quota's rate.
+A call reserves one request and its estimated tokens up front; when that
+takes a bucket below zero the caller queues for as long as the debt takes
+to refill, so a 9am burst is spread out at quota instead of coming back as
+429s. Waits are bounded: a call that would wait longer than
+max_wait_seconds (or past its deadline) fails at once with RateLimited.
+Once a call finishes, its bucket is corrected with the real token count.
+
+Buckets live in memory by default, which limits one process. With a
+SQLite path every process sharing the file draws from the same buckets.
+"""
+import asyncio
+import os
+import sqlite3
+import threading
+import time
+
+class RateLimited(Exception):
+    """A call would have had to queue longer than allowed for rate-limit capacity"""
+
+def estimate_tokens(contents, output_tokens):
+    """Roughly estimate the tokens a call uses: about four characters per input token, plus its output"""
+    if isinstance(contents, str):
+        contents = [contents]
+    chars = 0
+    for content in contents:
+        if isinstance(content, str):
+            chars += len(content)
+        else:
+            chars += sum(len(part.text or "") for part in content.parts or [])
+    return chars // 4 + output_tokens
+
+def _take(buckets, entries, now, max_wait=None):
+    """Refill buckets and take amounts from them, returning the wait until they are repaid
+
+    buckets maps a name to [tokens, updated]; entries are (name, amount,
+    rate per second, capacity). With max_wait, nothing is taken and None is
+    returned when the wait would be longer.
+    """
+    levels = {}
+    for name, amount, rate, capacity in entries:
+        tokens, updated = buckets.get(name, (capacity, now))
+        levels[name] = min(capacity, tokens + (now - updated) * rate) - amount
+
+    wait = max((-levels[name] / rate for name, _, rate, _ in entries), default=0)
+    if max_wait is not None and wait > max_wait:
+        return None
+
+    for name in levels:
+        buckets[name] = [levels[name], now]
+    return max(0.0, wait)
+
+class MemoryBuckets:
+    """Buckets shared by the threads of one process"""
+
+    def __init__(self):
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def take(self, entries, max_wait=None):
+        with self._lock:
+            return _take(self._buckets, entries, time.monotonic(), max_wait)
+
+class SQLiteBuckets:
+    """Buckets shared by every process using the same database file"""
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None, timeout=5)
+        self._conn.execute('PRAGMA journal_mode = WAL')
+        self._conn.execute('''
+            CREATE TABLE IF NOT EXISTS rate_buckets (
+                name TEXT PRIMARY KEY,
+                tokens REAL NOT NULL,
+                updated REAL NOT NULL
+            )
+        ''')
+
+    def take(self, entries, max_wait=None):
+        names = [name for name, _, _, _ in entries]
+        with self._lock:
+            # IMMEDIATE takes the write lock up front, so concurrent processes
+            # read and update the buckets one at a time
+            self._conn.execute('BEGIN IMMEDIATE')
+            try:
+                rows = self._conn.execute(
+                    f'SELECT name, tokens, updated FROM rate_buckets WHERE name IN ({",".join("?" * len(names))})',
+                    names
+                ).fetchall()
+                buckets = {name: [tokens, updated] for name, tokens, updated in rows}
+                # Wall-clock time, since it is compared across processes
+                wait = _take(buckets, entries, time.time(), max_wait)
+                if wait is not None:
+                    self._conn.executemany(
+                        'INSERT OR REPLACE INTO rate_buckets (name, tokens, updated) VALUES (?, ?, ?)',
+                        [(name, *buckets[name]) for name in names]
+                    )
+                self._conn.execute('COMMIT')
+            except BaseException:
+                self._conn.execute('ROLLBACK')
+                raise
+        return wait
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+class RateLimiter:
+    def __init__(self, rpm=None, tpm=None, limits=None, max_wait_seconds=30.0, output_tokens=1024,
+                 db_path=None):
+        # Default requests and tokens per minute for every model, None for no
+        # limit; limits maps a model to its own (rpm, tpm)
+        self.rpm = rpm
+        self.tpm = tpm
+        self.limits = limits or {}
+        self.max_wait_seconds = max_wait_seconds
+        # Output tokens assumed for a call until its real usage is known
+        self.output_tokens = output_tokens
+        self.buckets = SQLiteBuckets(db_path) if db_path else MemoryBuckets()
+
+    @classmethod
+    def from_env(cls, models=()):
+        """Build a limiter from LLM_RPM/LLM_TPM and LLM_RATE_* environment variables, or None when unset
+
+        LLM_RPM and LLM_TPM apply to every model; LLM_RPM_GEMINI_2_5_PRO and
+        LLM_TPM_GEMINI_2_5_PRO override them for one of models.
+        """
+        def limit(name):
+            value = os.getenv(name)
+            return float(value) if value else None
+
+        limits = {}
+        for model in models:
+            suffix = model.replace("-", "_").replace(".", "_").upper()
+            rpm, tpm = limit(f"LLM_RPM_{suffix}"), limit(f"LLM_TPM_{suffix}")
+            if rpm or tpm:
+                limits[model] = (rpm or limit("LLM_RPM"), tpm or limit("LLM_TPM"))
+
+        rpm, tpm = limit("LLM_RPM"), limit("LLM_TPM")
+        if not (rpm or tpm or limits):
+            return None
+        return cls(
+            rpm=rpm,
+            tpm=tpm,
+            limits=limits,
+            max_wait_seconds=float(os.getenv("LLM_RATE_MAX_WAIT_SECONDS", "30")),
+            output_tokens=int(os.getenv("LLM_RATE_OUTPUT_TOKENS", "1024")),
+            db_path=os.getenv("LLM_RATE_DB") or None
+        )
+
+    def _entries(self, model, requests, tokens):
+        """Get the bucket entries charging a model for requests and tokens"""
+        rpm, tpm = self.limits.get(model, (self.rpm, self.tpm))
+        entries = []
+        if rpm:
+            entries.append((f"{model}:requests", requests, rpm / 60, rpm))
+        if tpm:
+            entries.append((f"{model}:tokens", tokens, tpm / 60, tpm))
+        return entries
+
+    async def _take(self, entries, max_wait=None):
+        if isinstance(self.buckets, MemoryBuckets):
+            return self.buckets.take(entries, max_wait)
+        # Keep SQLite's lock waits off the event loop
+        return await asyncio.to_thread(self.buckets.take, entries, max_wait)
+
+    async def acquire(self, model, contents, deadline=None, max_wait=None):
+        """Reserve capacity for one call, queueing until it is available; returns the tokens reserved
+
+        Raises RateLimited without reserving anything when the queue wait
+        would exceed max_wait (max_wait_seconds by default) or run past
+        deadline (a time.monotonic() value).
+        """
+        tokens = estimate_tokens(contents, self.output_tokens)
+        entries = self._entries(model, 1, tokens)
+        if not entries:
+            return tokens
+
+        if max_wait is None:
+            max_wait = self.max_wait_seconds
+        if deadline is not None:
+            max_wait = min(max_wait, deadline - time.monotonic())
+        wait = await self._take(entries, max_wait)
+        if wait is None:
+            raise RateLimited(f"{model} is over its rate limit")
+
+        try:
+            await asyncio.sleep(wait)
+        except asyncio.CancelledError:
+            # Give the capacity back to the callers still queueing
+            await asyncio.shield(self.refund(model, tokens))
+            raise
+        return tokens
+
+    async def refund(self, model, tokens):
+        """Give back a reservation acquire made for a call that was never sent"""
+        await self._take(self._entries(model, -1, -tokens))
+
+    async def settle(self, model, reserved, used):
+        """Correct a model's token bucket once a call's real token count is known"""
+        if used is not None:
+            await self._take(self._entries(model, 0, used - reserved))
@@ -0,0 +1,90 @@
+"""
+Retry and circuit-breaker policy for model calls
+
+Transient upstream failures (rate limiting, 5xx responses, dropped
+connections, attempts that time out) are retried a bounded number of times
+with full-jitter exponential backoff, so a burst of failures does not come
+back as a synchronized burst of retries. Each model also has a circuit
+breaker: after enough consecutive transient failures it opens and calls to
+that model fail at once with CircuitOpen instead of queueing up behind a
+brownout. Once reset_seconds have passed a single trial call is let through,
+and its outcome closes the circuit again or keeps it open.
+"""
+import random
+import threading
+import time
+import httpx
+from google.genai import errors
+
+# Statuses worth retrying: timeouts, rate limits and server-side trouble
+TRANSIENT_STATUS_CODES = {408, 429, 500, 502, 503, 504}
+
+class CircuitOpen(Exception):
+    """A model's circuit breaker is open, so the call was not attempted"""
+
+def is_transient(error):
+    """Whether a failed call may succeed if it is simply tried again"""
+    if isinstance(error, errors.APIError):
+        return error.code in TRANSIENT_STATUS_CODES
+    # TimeoutError covers attempts that ran past their route's timeout
+    return isinstance(error, (httpx.TransportError, ConnectionError, TimeoutError))
+
+class RetryPolicy:
+    def __init__(self, max_attempts=3, base_seconds=0.5, max_seconds=8.0):
+        self.max_attempts = max(1, max_attempts)
+        self.base_seconds = base_seconds
+        self.max_seconds = max_seconds
+
+    def backoff(self, attempt):
+        """Get how long to sleep after the given failed attempt (0-based), with full jitter"""
+        return random.uniform(0, min(self.max_seconds, self.base_seconds * 2 ** attempt))
+
+class CircuitBreaker:
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold=5, reset_seconds=30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+
+        self.state = self.CLOSED
+        self.failures = 0
+        # When the circuit opened, or when the half-open trial call started
+        self._since = 0.0
+        self._lock = threading.Lock()
+
+    def allow(self):
+        """Whether a call may go ahead; an open circuit lets one trial call through once it is due"""
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+
+            # A trial that never reported back (cancelled, say) must not
+            # keep the circuit half-open forever, so it is due again too
+            now = time.monotonic()
+            if now - self._since < self.reset_seconds:
+                return False
+            self.state = self.HALF_OPEN
+            self._since = now
+            return True
+
+    def retry_after(self):
+        """Get the seconds until an open circuit lets a trial call through"""
+        with self._lock:
+            if self.state == self.CLOSED:
+                return 0.0
+            return max(0.0, self.reset_seconds - (time.monotonic() - self._since))
+
+    def record_success(self):
+        with self._lock:
+            self.state = self.CLOSED
+            self.failures = 0
+
+    def record_failure(self):
+        """Count a transient failure, opening the circuit at the threshold or when a trial fails"""
+        with self._lock:
+            self.failures += 1
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                self.state = self.OPEN
+                self._since = time.monotonic()
@@ -0,0 +1,178 @@
+"""
+Two-tier cache for generated tutor content
+
+Responses that depend only on the subject and topic are the same for every
+student, so they are cached under a hash of the model and prompt: first in an
+in-process LRU, then in a small SQLite database shared by every worker. Entries
+expire after a TTL and both tiers are size bounded. A key can hold up to K
+variants; until it has K the caller generates a fresh one, after that a random
+cached variant is served, which keeps some diversity without paying for it.
+"""
+import hashlib
+import os
+import random
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+class ResponseCache:
+    def __init__(self, db_path="llm_cache.db", ttl_seconds=7 * 24 * 3600,
+                 max_memory_entries=512, max_disk_entries=10000, variants=1):
+        self.db_path = db_path
+        self.ttl_seconds = ttl_seconds
+        self.max_memory_entries = max_memory_entries
+        self.max_disk_entries = max_disk_entries
+        self.variants = variants
+
+        # key -> list of (text, created_at), most recently used last
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._puts_since_eviction = 0
+
+        self._conn = sqlite3.connect(db_path, check_same_thread=False)
+        self._conn.execute('PRAGMA journal_mode = WAL')
+        self._conn.execute('PRAGMA synchronous = NORMAL')
+        self._conn.execute('''
+            CREATE TABLE IF NOT EXISTS llm_responses (
+                cache_key TEXT NOT NULL,
+                variant INTEGER NOT NULL,
+                response TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                last_access REAL NOT NULL,
+                PRIMARY KEY (cache_key, variant)
+            )
+        ''')
+        self._conn.execute('''
+            CREATE INDEX IF NOT EXISTS idx_llm_responses_last_access
+            ON llm_responses (last_access)
+        ''')
+        self._conn.commit()
+
+    @classmethod
+    def from_env(cls):
+        """Build the cache from LLM_CACHE_* environment variables, or None when LLM_CACHE=0"""
+        if os.getenv("LLM_CACHE", "1") == "0":
+            return None
+        return cls(
+            db_path=os.getenv("LLM_CACHE_DB", "llm_cache.db"),
+            ttl_seconds=float(os.getenv("LLM_CACHE_TTL_HOURS", "168")) * 3600,
+            max_memory_entries=int(os.getenv("LLM_CACHE_MEMORY_ENTRIES", "512")),
+            max_disk_entries=int(os.getenv("LLM_CACHE_DISK_ENTRIES", "10000")),
+            variants=int(os.getenv("LLM_CACHE_VARIANTS", "1"))
+        )
+
+    @staticmethod
+    def make_key(model, prompt):
+        """Hash the model and prompt into a cache key"""
+        return hashlib.sha256(f"{model}\0{prompt}".encode()).hexdigest()
+
+    def _load(self, key, from_disk=False):
+        """Get a key's variants from memory, falling back to disk"""
+        with self._lock:
+            entries = None if from_disk else self._memory.get(key)
+            if entries is not None:
+                self._memory.move_to_end(key)
+                return list(entries)
+
+            rows = self._conn.execute('''
+                SELECT response, created_at FROM llm_responses
+                WHERE cache_key = ?
+                ORDER BY variant
+            ''', (key,)).fetchall()
+
+            if rows:
+                self._conn.execute(
+                    'UPDATE llm_responses SET last_access = ? WHERE cache_key = ?',
+                    (time.time(), key)
+                )
+                self._conn.commit()
+                self._remember(key, list(rows))
+            return list(rows)
+
+    def _remember(self, key, entries):
+        """Store variants in the LRU tier; call with the lock held"""
+        self._memory[key] = entries
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_memory_entries:
+            self._memory.popitem(last=False)
+
+    def get(self, key, variants=None, allow_stale=False):
+        """Get a cached response, or None when a fresh one should be generated
+
+        With allow_stale the TTL and variant count are ignored, so any cached
+        response is served; use it when the upstream cannot answer.
+        """
+        variants = variants or self.variants
+        entries = self._load(key)
+        if not allow_stale:
+            cutoff = time.time() - self.ttl_seconds
+            entries = [entry for entry in entries if entry[1] >= cutoff]
+            if len(entries) < variants:
+                # Other workers may have added variants since memory was filled
+                entries = [entry for entry in self._load(key, from_disk=True) if entry[1] >= cutoff]
+            if len(entries) < variants:
+                return None
+
+        if not entries:
+            return None
+        return random.choice(entries)[0]
+
+    def put(self, key, text, variants=None):
+        """Cache a response, as a new variant if the key has room for one"""
+        variants = variants or self.variants
+        now = time.time()
+        cutoff = now - self.ttl_seconds
+
+        with self._lock:
+            rows = self._conn.execute('''
+                SELECT variant, response, created_at FROM llm_responses
+                WHERE cache_key = ?
+                ORDER BY variant
+            ''', (key,)).fetchall()
+
+            # Another worker may have added variants since this one loaded the
+            # key, so memory is refreshed from disk rather than appended to
+            fresh = [(response, created_at) for _, response, created_at in rows if created_at >= cutoff]
+            if len(fresh) >= variants:
+                self._remember(key, fresh)
+                return
+
+            # Reuse an expired slot before adding a new one
+            expired = [variant for variant, _, created_at in rows if created_at < cutoff]
+            used = {variant for variant, _, _ in rows}
+            slot = expired[0] if expired else next(i for i in range(len(used) + 1) if i not in used)
+
+            self._conn.execute('''
+                INSERT OR REPLACE INTO llm_responses (cache_key, variant, response, created_at, last_access)
+                VALUES (?, ?, ?, ?, ?)
+            ''', (key, slot, text, now, now))
+            self._conn.commit()
+
+            fresh.append((text, now))
+            self._remember(key, fresh)
+
+            self._puts_since_eviction += 1
+            if self._puts_since_eviction >= 100:
+                self._evict()
+
+    def _evict(self):
+        """Drop expired rows and the least recently used ones beyond the size bound"""
+        self._puts_since_eviction = 0
+        self._conn.execute(
+            'DELETE FROM llm_responses WHERE created_at < ?',
+            (time.time() - self.ttl_seconds,)
+        )
+        self._conn.execute('''
+            DELETE FROM llm_responses
+            WHERE rowid IN (
+                SELECT rowid FROM llm_responses
+                ORDER BY last_access DESC
+                LIMIT -1 OFFSET ?
+            )
+        ''', (self.max_disk_entries,))
+        self._conn.commit()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -0,0 +1,118 @@
+"""
+Priority scheduling of the gateway's concurrency slots
+
+Every model call needs one of the gateway's slots. When they are all busy,
+callers queue by priority class: students chatting, students waiting on a
+quiz, speculative prefetches and batch pool warm-up. Freed slots go to the
+queued classes in proportion to their weights (stride scheduling), so
+background work still gets a trickle under load but never crowds out
+interactive requests. Once enough interactive requests are queued, queued
+background work is dropped with Preempted. Background calls that already
+hold a slot are left to finish.
+"""
+import asyncio
+from collections import deque
+from contextlib import asynccontextmanager
+
+# class -> share of contended slots, and whether queued work may be dropped
+PRIORITY_CLASSES = {
+    "chat": {"weight": 8, "preemptible": False},
+    "quiz": {"weight": 4, "preemptible": False},
+    "prefetch": {"weight": 2, "preemptible": True},
+    "warmup": {"weight": 1, "preemptible": True},
+}
+
+class Preempted(Exception):
+    """Queued background work was dropped to make room for interactive requests"""
+
+class PriorityScheduler:
+    def __init__(self, slots, classes=None, preempt_queue_length=1):
+        # Only ever used on the gateway loop, so no locking
+        self.slots = slots
+        self.classes = classes or PRIORITY_CLASSES
+        # Interactive requests that must be queued before background work is dropped
+        self.preempt_queue_length = preempt_queue_length
+
+        self._free = slots
+        self._queues = {name: deque() for name in self.classes}
+        # Stride scheduling: the class with the lowest pass is served next,
+        # and serving it advances its pass by 1 / weight
+        self._pass = {name: 0.0 for name in self.classes}
+        self._clock = 0.0
+        self.preempted = 0
+
+    def preemptible(self, priority):
+        return self.classes[priority]["preemptible"]
+
+    @asynccontextmanager
+    async def slot(self, priority):
+        """Hold a slot for the duration of the block, queueing for one at the given priority"""
+        await self.acquire(priority)
+        try:
+            yield
+        finally:
+            self.release()
+
+    async def acquire(self, priority):
+        if self._free > 0 and not any(self._queues.values()):
+            self._free -= 1
+            return
+
+        queue = self._queues[priority]
+        if not queue:
+            # A class coming back from idle starts level with the others
+            # instead of with credit saved up while it had nothing to run
+            self._pass[priority] = max(self._pass[priority], self._clock)
+        waiter = asyncio.get_running_loop().create_future()
+        queue.append(waiter)
+        if not self.preemptible(priority):
+            self._preempt()
+
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            if waiter in queue:
+                queue.remove(waiter)
+            elif not waiter.cancelled() and waiter.exception() is None:
+                # Granted a slot just as the caller gave up; pass it on
+                self.release()
+            raise
+
+    def release(self):
+        self._free += 1
+        self._dispatch()
+
+    def _dispatch(self):
+        """Hand free slots to queued callers, lowest pass first"""
+        while self._free > 0:
+            ready = [name for name, queue in self._queues.items() if queue]
+            if not ready:
+                return
+            name = min(ready, key=self._pass.get)
+            waiter = self._queues[name].popleft()
+            if waiter.done():
+                # Cancelled while queued
+                continue
+            self._clock = self._pass[name]
+            self._pass[name] += 1 / self.classes[name]["weight"]
+            self._free -= 1
+            waiter.set_result(None)
+
+    def _preempt(self):
+        """Drop queued background work once enough interactive requests are queued"""
+        interactive = sum(len(queue) for name, queue in self._queues.items() if not self.preemptible(name))
+        if interactive < self.preempt_queue_length:
+            return
+
+        for name, queue in self._queues.items():
+            if not self.preemptible(name):
+                continue
+            while queue:
+                waiter = queue.popleft()
+                if not waiter.done():
+                    waiter.set_exception(Preempted(f"queued {name} work dropped for interactive requests"))
+                    self.preempted += 1
+
+    def snapshot(self):
+        """Get the free slots and queue length of every class"""
+        return {"free": self._free, **{name: len(queue) for name, queue in self._queues.items()}}
@@ -1,50 +1,92 @@
-import os
-import json
-from google import genai
+import asyncio
 from google.genai import types
+from llm_gateway import get_gateway
+from response_cache import ResponseCache
 
 class TutorEngine:
-    def __init__(self):
-        # Using Google Gemini AI for educational content generation
-        self.client = genai.Client(api_key=os.getenv("GEMINI_API_KEY"))
-        self.model = "gemini-2.5-flash"
+    # Practice problems are served from a few cached variants so students
+    # on the same topic do not all get the identical problem
+    PRACTICE_PROBLEM_VARIANTS = 3
     
-    def generate_response(self, subject, topic, question, chat_history=None):
+    def __init__(self, gateway=None, response_cache=None):
+        # Using Google Gemini AI for educational content generation, through
+        # the process-wide gateway so the HTTP client is shared
+        self.gateway = gateway or get_gateway()
+        # Topic-only content is identical for every student, so it is cached
+        self.cache = response_cache if response_cache is not None else ResponseCache.from_env()
+    
+    async def _agenerate_cached(self, route, prompt, variants=None, deadline=None):
+        """Generate text for a prompt that does not depend on the student, via the response cache"""
+        primary = self.gateway.model_for(route)
+        key = ResponseCache.make_key(primary, prompt)
+        # The cache is SQLite shared with other processes, so its lock waits
+        # are kept off the gateway loop that every generation runs on
+        if self.cache:
+            cached = await asyncio.to_thread(self.cache.get, key, variants)
+            if cached is not None:
+                return cached
+        
+        try:
+            response, model = await self.gateway.agenerate(
+                route,
+                prompt,
+                deadline=deadline,
+                return_model=True
+            )
+        except Exception:
+            # While the model is failing, an expired answer beats an error
+            stale = await asyncio.to_thread(self.cache.get, key, variants, True) if self.cache else None
+            if stale is None:
+                raise
+            return stale
+        
+        # Never cache an empty answer, nor one a fallback model gave: it
+        # would be served under the primary's key for the whole TTL
+        if self.cache and response.text and model == primary:
+            await asyncio.to_thread(self.cache.put, key, response.text, variants)
+        return response.text
+    
+    def _build_response_prompt(self, subject, topic, question, chat_history=None):
+        """Build the tutoring prompt for a student's question"""
+        # Build context from chat history
+        context = ""
+        if chat_history:
+            context = "\n".join([
+                f"{'Student' if msg['role'] == 'user' else 'Tutor'}: {msg['content']}"
+                for msg in chat_history[-5:]  # Last 5 messages for context
+            ])
+        
+        # Create the tutoring prompt
+        system_prompt = f"""You are an expert educational tutor specializing in {subject}. 
+        You are currently helping a student learn about {topic}.
+        
+        Your teaching style should be:
+        - Patient and encouraging
+        - Use step-by-step explanations
+        - Provide examples when helpful
+        - Ask guiding questions to help student think
+        - Adapt to the student's level of understanding
+        - Be concise but thorough
+        
+        Previous conversation context:
+        {context}
+        """
+        
+        user_prompt = f"""Student's question about {topic}: {question}
+        
+        Please provide a helpful tutoring response that guides the student's learning."""
+        
+        return [
+            types.Content(role="user", parts=[types.Part(text=f"{system_prompt}\n\n{user_prompt}")])
+        ]
+    
+    async def agenerate_response(self, subject, topic, question, chat_history=None, deadline=None):
         """Generate a tutoring response based on the question and context"""
         try:
-            # Build context from chat history
-            context = ""
-            if chat_history:
-                context = "\n".join([
-                    f"{'Student' if msg['role'] == 'user' else 'Tutor'}: {msg['content']}"
-                    for msg in chat_history[-5:]  # Last 5 messages for context
-                ])
-            
-            # Create the tutoring prompt
-            system_prompt = f"""You are an expert educational tutor specializing in {subject}. 
-            You are currently helping a student learn about {topic}.
-            
-            Your teaching style should be:
-            - Patient and encouraging
-            - Use step-by-step explanations
-            - Provide examples when helpful
-            - Ask guiding questions to help student think
-            - Adapt to the student's level of understanding
-            - Be concise but thorough
-            
-            Previous conversation context:
-            {context}
-            """
-            
-            user_prompt = f"""Student's question about {topic}: {question}
-            
-            Please provide a helpful tutoring response that guides the student's learning."""
-            
-            response = self.client.models.generate_content(
-                model=self.model,
-                contents=[
-                    types.Content(role="user", parts=[types.Part(text=f"{system_prompt}\n\n{user_prompt}")])
-                ]
+            response = await self.gateway.agenerate(
+                "tutor.generate_response",
+                self._build_response_prompt(subject, topic, question, chat_history),
+                deadline=deadline
             )
             
             return response.text or "I apologize, but I'm having trouble processing your question right now."
@@ -52,7 +94,32 @@ class TutorEngine:
         except Exception as e:
             return f"I apologize, but I'm having trouble processing your question right now. Please try again or rephrase your question. Error: {str(e)}"
     
-    def get_learning_tips(self, subject, topic):
+    async def agenerate_response_stream(self, subject, topic, question, chat_history=None, deadline=None):
+        """Generate a tutoring response as a stream of text chunks
+        
+        Yields the same text generate_response would return, piece by piece as
+        the model produces it, so the reply can be shown before it is finished.
+        """
+        received = False
+        try:
+            async for chunk in self.gateway.astream(
+                "tutor.generate_response",
+                self._build_response_prompt(subject, topic, question, chat_history),
+                deadline=deadline
+            ):
+                if chunk.text:
+                    received = True
+                    yield chunk.text
+            
+            if not received:
+                yield "I apologize, but I'm having trouble processing your question right now."
+            
+        except Exception as e:
+            # Keep whatever was already shown and explain the interruption
+            separator = "\n\n" if received else ""
+            yield f"{separator}I apologize, but I'm having trouble processing your question right now. Please try again or rephrase your question. Error: {str(e)}"
+    
+    async def aget_learning_tips(self, subject, topic, deadline=None):
         """Generate learning tips for a specific topic"""
         try:
             prompt = f"""As an expert {subject} tutor, provide 3-5 specific learning tips for studying {topic}. 
@@ -60,17 +127,14 @@ class TutorEngine:
             
             Format your response as a helpful guide with actionable tips."""
             
-            response = self.client.models.generate_content(
-                model=self.model,
-                contents=prompt
-            )
+            text = await self._agenerate_cached("tutor.get_learning_tips", prompt, deadline=deadline)
             
-            return "🎯 **Learning Tips for " + topic + ":**\n\n" + (response.text or "Unable to generate learning tips at the moment.")
+            return "🎯 **Learning Tips for " + topic + ":**\n\n" + (text or "Unable to generate learning tips at the moment.")
             
         except Exception as e:
             return f"Unable to generate learning tips at the moment. Please try again later. Error: {str(e)}"
     
-    def generate_practice_problem(self, subject, topic):
+    async def agenerate_practice_problem(self, subject, topic, deadline=None):
         """Generate a practice problem for the topic"""
         try:
             prompt = f"""Create a practice problem for {subject} - {topic} that would help a student understand the key concepts.
@@ -82,18 +146,15 @@ class TutorEngine:
             
             Make it educational and appropriately challenging. Don't include the solution - the student should work through it."""
             
-            response = self.client.models.generate_content(
-                model=self.model,
-                contents=prompt
-            )
+            text = await self._agenerate_cached("tutor.generate_practice_problem", prompt, self.PRACTICE_PROBLEM_VARIANTS, deadline)
             
-            content = response.text or "Unable to generate practice problem at this time."
+            content = text or "Unable to generate practice problem at this time."
             return "📝 **Practice Problem:**\n\n" + content + "\n\n*Try to solve this step by step, and feel free to ask for hints if you get stuck!*"
             
         except Exception as e:
             return f"Unable to generate a practice problem at the moment. Please try again later. Error: {str(e)}"
     
-    def explain_concept(self, subject, topic):
+    async def aexplain_concept(self, subject, topic, deadline=None):
         """Provide a clear explanation of the topic concept"""
         try:
             prompt = f"""Provide a clear, comprehensive explanation of {topic} in {subject}.
@@ -107,17 +168,14 @@ class TutorEngine:
             
             Make it accessible but thorough, suitable for someone learning this topic."""
             
-            response = self.client.models.generate_content(
-                model=self.model,
-                contents=prompt
-            )
+            text = await self._agenerate_cached("tutor.explain_concept", prompt, deadline=deadline)
             
-            return "🔍 **Concept Explanation: " + topic + "**\n\n" + (response.text or "Unable to provide concept explanation at the moment.")
+            return "🔍 **Concept Explanation: " + topic + "**\n\n" + (text or "Unable to provide concept explanation at the moment.")
             
         except Exception as e:
             return f"Unable to provide concept explanation at the moment. Please try again later. Error: {str(e)}"
     
-    def get_study_recommendations(self, subject, topic, performance_data):
+    async def aget_study_recommendations(self, subject, topic, performance_data, deadline=None):
         """Get personalized study recommendations based on performance"""
         try:
             prompt = f"""Based on a student's performance in {subject} - {topic}, provide personalized study recommendations.
@@ -132,12 +190,40 @@ class TutorEngine:
             
             Be encouraging and constructive."""
             
-            response = self.client.models.generate_content(
-                model=self.model,
-                contents=prompt
+            response = await self.gateway.agenerate(
+                "tutor.get_study_recommendations",
+                prompt,
+                deadline=deadline
             )
             
             return response.text or "Unable to generate recommendations at the moment."
             
         except Exception as e:
             return f"Unable to generate recommendations at the moment. Please try again later. Error: {str(e)}"
+    
+    # Blocking versions for Streamlit pages; each runs on the gateway's event loop.
+    # Every method takes an optional deadline (see llm_gateway.deadline_in).
+    
+    def generate_response(self, subject, topic, question, chat_history=None, deadline=None):
+        """Generate a tutoring response based on the question and context"""
+        return self.gateway.run(self.agenerate_response(subject, topic, question, chat_history, deadline))
+    
+    def generate_response_stream(self, subject, topic, question, chat_history=None, deadline=None):
+        """Generate a tutoring response as a stream of text chunks"""
+        return self.gateway.iterate(self.agenerate_response_stream(subject, topic, question, chat_history, deadline))
+    
+    def get_learning_tips(self, subject, topic, deadline=None):
+        """Generate learning tips for a specific topic"""
+        return self.gateway.run(self.aget_learning_tips(subject, topic, deadline))
+    
+    def generate_practice_problem(self, subject, topic, deadline=None):
+        """Generate a practice problem for the topic"""
+        return self.gateway.run(self.agenerate_practice_problem(subject, topic, deadline))
+    
+    def explain_concept(self, subject, topic, deadline=None):
+        """Provide a clear explanation of the topic concept"""
+        return self.gateway.run(self.aexplain_concept(subject, topic, deadline))
+    
+    def get_study_recommendations(self, subject, topic, performance_data, deadline=None):
+        """Get personalized study recommendations based on performance"""
+        return self.gateway.run(self.aget_study_recommendations(subject, topic, performance_data, deadline))